@@ -10,6 +10,9 @@ cross_size = 2
 # Mutation Globals
 lo_muts_per_indiv = 1
 hi_muts_per_indiv = 100
+# Optional bloat limit: bigger Rules of new Individuals lose random branches.
+# None for no limit.
+max_rule_nodes = None
 
 # robogentest Globals
 spawn_square = (7,1)
@@ -27,10 +30,19 @@ enemy_loc = (10, 10)
 # robogen Globals
 default_save = "gen_save"
 default_backup = "gen_backup"
+default_cache = "match_cache.p"
+default_history = "history.db"
+# Seconds a remote worker has to finish a game before it is given to another
+task_timeout = 120.0
+# Seconds a remote worker waits before connecting again
+retry_delay = 2.0
 backup_frequency = 10
 
 rloc_max_step = 2
 default_cpu_count = 7
 num_coded_opponents = 1
 games_per_scoring = 3
+# Confidence of the score bounds used to stop scoring hopeless Individuals early,
+# over every check of the bounds during a scoring
+racing_confidence = 0.95
 rloc_gauss_sigma = 5
\ No newline at end of file
@@ -0,0 +1,109 @@
+"""Console control of a running evolution, on any platform.
+
+The work thread posts events to a Controller and checks it for stop requests.
+The main thread waits on the Controller's events, so progress is shown and a
+stop is acted on as soon as it happens. A stop is requested by SIGINT,
+SIGTERM or pressing SPACE."""
+
+import os
+import sys
+import signal
+import threading
+import Queue
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+try:
+    import termios
+    import tty
+except ImportError:
+    termios = None
+
+STOP_KEY = " "
+
+
+class Controller:
+    """Event channel between the work thread and the console."""
+
+    def __init__(self):
+        self._events = Queue.Queue()
+        self._stop = threading.Event()
+        self._saved_terminal = None
+
+    def post_progress(self, progress):
+        """Called by the work thread with a ProgressInfo after each Generation."""
+
+        self._events.put(("progress", progress))
+
+    def request_stop(self):
+        """Asks the work thread to save and finish after its current Generation."""
+
+        if not self._stop.is_set():
+            self._stop.set()
+            self._events.put(("stop", None))
+
+    def stop_requested(self):
+        return self._stop.is_set()
+
+    def next_event(self, timeout=None):
+        """Returns the next (kind, value) event, or None after timeout seconds."""
+
+        try:
+            # Without a timeout the wait couldn't be interrupted by signals
+            return self._events.get(timeout=timeout if timeout is not None else 1e9)
+        except Queue.Empty:
+            return None
+
+    def install_signal_handlers(self):
+        """SIGINT and SIGTERM request a stop. A second one exits without saving.
+
+        Must be called from the main thread."""
+
+        signal.signal(signal.SIGINT, self._handle_signal)
+        signal.signal(signal.SIGTERM, self._handle_signal)
+
+    def _handle_signal(self, signum, frame):
+        if self.stop_requested():
+            raise SystemExit("Exiting without saving")
+        self.request_stop()
+
+    def start_key_reader(self):
+        """Reads keys on a background thread, requesting a stop on STOP_KEY.
+
+        A terminal is switched to unbuffered input until close() is called.
+        Does nothing if there is no input to read."""
+
+        if msvcrt is None:
+            try:
+                fd = sys.stdin.fileno()
+            except (AttributeError, ValueError):
+                return
+            if termios is not None and os.isatty(fd):
+                self._saved_terminal = termios.tcgetattr(fd)
+                tty.setcbreak(fd)
+        reader = threading.Thread(target=self._read_keys)
+        reader.daemon = True
+        reader.start()
+
+    def _read_keys(self):
+        while True:
+            if msvcrt is not None:
+                key = msvcrt.getch()
+            else:
+                try:
+                    key = os.read(sys.stdin.fileno(), 1)
+                except OSError:
+                    return
+                if not key:
+                    return
+            if key == STOP_KEY:
+                self.request_stop()
+
+    def close(self):
+        """Restores the terminal."""
+
+        if self._saved_terminal is not None:
+            termios.tcsetattr(sys.stdin.fileno(), termios.TCSADRAIN,
+                              self._saved_terminal)
+            self._saved_terminal = None
@@ -0,0 +1,164 @@
+import os
+import time
+import binascii
+import threading
+import traceback
+import Queue
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+import constants
+
+
+def make_authkey():
+    """Returns a new random secret for a Coordinator and its workers.
+
+    multiprocessing connections unpickle what they receive, so anybody who
+    knows the secret can run code on either side."""
+
+    return binascii.hexlify(os.urandom(16))
+
+
+def parse_address(address):
+    """Turns "host:port" (or just "port") into a (host, port) address."""
+
+    host, _, port = address.rpartition(":")
+    return (host or "localhost", int(port))
+
+
+class Coordinator:
+    """Hands out tasks to workers that connect to it over TCP.
+
+    Stands in for a multiprocessing Pool: imap_unordered() queues every task,
+    and each connected worker is sent the next queued task whenever it is free.
+    A task is queued again if its worker disconnects or takes longer than
+    timeout seconds to answer, and the worker's connection is dropped. Workers
+    can connect, leave and reconnect at any time."""
+
+    def __init__(self, address, authkey, timeout=constants.task_timeout):
+        self.num_workers = 0
+        self._timeout = timeout
+        self._tasks = Queue.Queue()
+        self._results = Queue.Queue()
+        self._next_id = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._serve_threads = []
+        self._listener = Listener(address, authkey=authkey)
+        # The address actually bound, such as the port picked for port 0
+        self.address = self._listener.address
+        accept_thread = threading.Thread(target=self._accept)
+        accept_thread.daemon = True
+        accept_thread.start()
+
+    def _accept(self):
+        while not self._closed:
+            try:
+                conn = self._listener.accept()
+            except (IOError, EOFError, AuthenticationError):
+                continue
+            serve_thread = threading.Thread(target=self._serve, args=(conn,))
+            serve_thread.daemon = True
+            serve_thread.start()
+            with self._lock:
+                self._serve_threads.append(serve_thread)
+
+    def _serve(self, conn):
+        """Feeds tasks to one worker until it fails or the Coordinator closes."""
+
+        with self._lock:
+            self.num_workers += 1
+        try:
+            while True:
+                try:
+                    task = self._tasks.get(timeout=1.0)
+                except Queue.Empty:
+                    if self._closed:
+                        conn.send(("stop",))
+                        break
+                    continue
+                task_id, func, arg = task
+                try:
+                    conn.send(("task", task_id, func, arg))
+                    if not conn.poll(self._timeout):
+                        raise IOError("task timed out")
+                    message = conn.recv()
+                except (IOError, EOFError):
+                    # Somebody else gets the task and this worker has to reconnect
+                    self._tasks.put(task)
+                    break
+                self._results.put(message)
+        except (IOError, EOFError):
+            pass
+        finally:
+            conn.close()
+            with self._lock:
+                self.num_workers -= 1
+
+    def imap_unordered(self, func, iterable, chunksize=1):
+        """Yields func(arg) for every arg as workers finish them, in any order.
+
+        chunksize is only accepted for compatibility with Pool, every task is
+        sent on its own."""
+
+        pending = set()
+        for arg in iterable:
+            task_id = self._next_id
+            self._next_id += 1
+            pending.add(task_id)
+            self._tasks.put((task_id, func, arg))
+        while pending:
+            kind, task_id, value = self._results.get()
+            # Answers to tasks of an earlier call are stale
+            if task_id not in pending:
+                continue
+            pending.remove(task_id)
+            if kind == "error":
+                raise RuntimeError("Task failed on a worker:\n" + value)
+            yield value
+
+    def close(self):
+        """Accepts no more workers, and tells connected ones to stop once they
+        are idle."""
+
+        self._closed = True
+        self._listener.close()
+
+    def join(self):
+        """Waits until every connected worker has been told to stop."""
+
+        with self._lock:
+            serve_threads = list(self._serve_threads)
+        for serve_thread in serve_threads:
+            serve_thread.join()
+
+
+def run_worker(address, authkey, initializer=None, retry_delay=constants.retry_delay):
+    """Plays tasks from the Coordinator at address until it says to stop.
+
+    Connects again after retry_delay seconds whenever the Coordinator can't be
+    reached or the connection drops."""
+
+    if initializer is not None:
+        initializer()
+    while True:
+        try:
+            conn = Client(address, authkey=authkey)
+        except (IOError, EOFError, AuthenticationError):
+            time.sleep(retry_delay)
+            continue
+        try:
+            while True:
+                message = conn.recv()
+                if message[0] == "stop":
+                    return
+                kind, task_id, func, arg = message
+                try:
+                    answer = ("result", task_id, func(arg))
+                except Exception:
+                    answer = ("error", task_id, traceback.format_exc())
+                conn.send(answer)
+        except (IOError, EOFError):
+            time.sleep(retry_delay)
+        finally:
+            conn.close()
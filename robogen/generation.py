@@ -30,11 +30,15 @@ class Generation:
         for x in range(constants.lo_mut_size):
             idx = Generation.half_gauss_range(len(self.population))
             clone = self.population[idx].do_mutations(constants.lo_muts_per_indiv)
+            clone.origin = "LO_MUT"
+            clone.parents = (self.population[idx].genome_hash(),)
             new_gen.population.append(clone)
         # High Rate Mutations
         for x in range(constants.hi_mut_size):
             idx = Generation.half_gauss_range(len(self.population))
             clone = self.population[idx].do_mutations(constants.hi_muts_per_indiv)
+            clone.origin = "HI_MUT"
+            clone.parents = (self.population[idx].genome_hash(),)
             new_gen.population.append(clone)
         # Cross Breeding
         for x in range(constants.cross_size):
@@ -44,7 +48,13 @@ class Generation:
                 idx2 = Generation.half_gauss_range(len(self.population))
             offspring = individual.Individual.cross(
                             self.population[idx1], self.population[idx2])
+            offspring.origin = "CROSS"
+            offspring.parents = (self.population[idx1].genome_hash(),
+                                 self.population[idx2].genome_hash())
             new_gen.population.append(offspring)
+        # Keep new Individuals free of dead Nodes, and within the bloat limit if set
+        for x in range(constants.elite_size, len(new_gen.population)):
+            new_gen.population[x].simplify(constants.max_rule_nodes)
         return new_gen
         
     # def print_scores(self):
@@ -0,0 +1,142 @@
+"""Compact, versioned encoding of Individuals and Generations.
+
+A Rule's Node tree is stored as a flat preorder array of fixed size node
+records, with every string field replaced by its index in a table below. Only
+what defines behavior, ranking and lineage is kept: scratch state such as the
+decision-sharing fields, compiled Rules and Nodes' parent pointers is not.
+
+Encodings are plain tuples of ints, floats and byte strings, so they pickle
+small and fast for saves, backups and worker tasks."""
+
+import sys
+from array import array
+
+from rules import Rule, Node
+from individual import Individual
+from generation import Generation
+
+# Bump on any change to the tables or record layout
+GENOME_VERSION = 2
+# Versions decode_generation can still read
+READABLE_VERSIONS = (1, 2)
+
+ACTIONS = ('move', 'attack', 'guard', 'suicide')
+ORIGINS = Individual.origin_types
+OPERATIONS = Node.operation_types
+ARG_TYPES = Node.arg_types
+RLOC_TYPES = Node.rloc_types
+COMP_OPS = Node.comp_ops + ("",)
+DIRECTIONS = Node.directions + (None,)
+
+# op, type, not_op, rloc_type, rloc x, rloc y, hp, comp_op, turns_since_spawn,
+# direction, number of children
+NODE_FIELDS = 11
+# Signed shorts hold every field. Records are stored little-endian.
+ARRAY_TYPE = 'h'
+
+
+def encode_rule(rule):
+    """Returns (action index, preorder node records as bytes)."""
+
+    records = array(ARRAY_TYPE)
+    stack = [rule.root] if rule.root is not None else []
+    while stack:
+        node = stack.pop()
+        records.extend((OPERATIONS.index(node.op), ARG_TYPES.index(node.type),
+                        int(bool(node.not_op)), RLOC_TYPES.index(node.rloc_type),
+                        node.rloc[0], node.rloc[1], node.hp,
+                        COMP_OPS.index(node.comp_op), node.turns_since_spawn,
+                        DIRECTIONS.index(node.direction), len(node.children)))
+        stack.extend(reversed(node.children))
+    if sys.byteorder != 'little':
+        records.byteswap()
+    return (ACTIONS.index(rule.action), records.tostring())
+
+
+def decode_rule(data):
+    """Rebuilds a Rule from encode_rule()."""
+
+    action, packed = data
+    rule = Rule(ACTIONS[action])
+    records = array(ARRAY_TYPE)
+    records.fromstring(packed)
+    if sys.byteorder != 'little':
+        records.byteswap()
+    # (parent, children left to read) of every Node still missing children
+    open_nodes = []
+    for x in range(0, len(records), NODE_FIELDS):
+        (op, arg_type, not_op, rloc_type, rloc_x, rloc_y, hp, comp_op, spawn,
+         direction, num_children) = records[x:x + NODE_FIELDS]
+        parent = open_nodes[-1][0] if open_nodes else None
+        node = Node(OPERATIONS[op], ARG_TYPES[arg_type], parent, hp,
+                    COMP_OPS[comp_op], spawn, RLOC_TYPES[rloc_type],
+                    (rloc_x, rloc_y), DIRECTIONS[direction], bool(not_op),
+                    parent is None)
+        rule.add_node(node)
+        if parent is None:
+            rule.root = node
+        else:
+            parent.children.append(node)
+            open_nodes[-1][1] -= 1
+            if open_nodes[-1][1] == 0:
+                open_nodes.pop()
+        if num_children > 0:
+            open_nodes.append([node, num_children])
+    return rule
+
+
+def encode_individual(individual):
+    """Returns (score, gens as elite, rules in evaluation order, origin index,
+    parents' genome hashes, score bounds)."""
+
+    return (individual.score, individual.gens_as_elite,
+            tuple(encode_rule(rule) for rule in individual.eval_order),
+            ORIGINS.index(individual.origin), tuple(individual.parents),
+            tuple(individual.score_bounds))
+
+
+def decode_individual(data):
+    """Rebuilds an Individual from encode_individual().
+
+    Version 1 records end after the rules; their Individuals keep the default
+    lineage and score bounds."""
+
+    score, gens_as_elite, encoded_rules = data[:3]
+    result = Individual()
+    result.score = score
+    result.gens_as_elite = gens_as_elite
+    if len(data) > 3:
+        origin, parents, score_bounds = data[3:]
+        result.origin = ORIGINS[origin]
+        result.parents = parents
+        result.score_bounds = score_bounds
+    result.eval_order = [decode_rule(rule) for rule in encoded_rules]
+    for rule in result.eval_order:
+        if rule.action == 'move':
+            result.move_rule = rule
+        elif rule.action == 'attack':
+            result.attack_rule = rule
+        elif rule.action == 'guard':
+            result.guard_rule = rule
+        else:
+            result.suicide_rule = rule
+    return result
+
+
+def encode_generation(generation):
+    """Returns (GENOME_VERSION, generation number, encoded Individuals)."""
+
+    return (GENOME_VERSION, generation.num,
+            [encode_individual(x) for x in generation.population])
+
+
+def decode_generation(data):
+    """Rebuilds a Generation from encode_generation()."""
+
+    version, num, population = data
+    if version not in READABLE_VERSIONS:
+        raise ValueError("Unsupported genome version {0}".format(version))
+    result = Generation()
+    result.num = num
+    result.population = [decode_individual(x) for x in population]
+    return result
@@ -0,0 +1,156 @@
+"""Append-only record of every Generation of a run, kept in SQLite.
+
+Each scored Generation adds one row per Individual with its encoded genome,
+score, score bounds and lineage, and every newly known match result is added
+once. Nothing already written is rewritten, so a long run's history can be
+queried, or resumed from any Generation, without loading it all.
+
+Every recorded Generation points at the one it was propagated from. Resuming
+from an earlier Generation starts a new branch beside the one already
+recorded, so both can be followed back to their common ancestors."""
+
+import time
+import sqlite3
+import cPickle as pickle
+
+import genome
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS generations (
+    id INTEGER PRIMARY KEY,
+    num INTEGER NOT NULL,
+    parent INTEGER REFERENCES generations(id),
+    genome_version INTEGER NOT NULL,
+    saved REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS generations_by_num ON generations (num);
+CREATE TABLE IF NOT EXISTS individuals (
+    generation INTEGER NOT NULL REFERENCES generations(id),
+    position INTEGER NOT NULL,
+    genome_hash TEXT NOT NULL,
+    genome BLOB NOT NULL,
+    score REAL NOT NULL,
+    score_low REAL,
+    score_high REAL,
+    gens_as_elite INTEGER NOT NULL,
+    origin TEXT NOT NULL,
+    parents TEXT NOT NULL,
+    PRIMARY KEY (generation, position)
+);
+CREATE INDEX IF NOT EXISTS individuals_by_hash ON individuals (genome_hash);
+CREATE TABLE IF NOT EXISTS matches (
+    player1 TEXT NOT NULL,
+    player2 TEXT NOT NULL,
+    seed TEXT NOT NULL,
+    map TEXT NOT NULL,
+    score1 INTEGER NOT NULL,
+    score2 INTEGER NOT NULL,
+    generation INTEGER NOT NULL REFERENCES generations(id),
+    PRIMARY KEY (player1, player2, seed, map)
+);
+"""
+
+
+class HistoryStore:
+    """An append-only SQLite log of Generations and match results.
+
+    Appended Generations descend from the Generation last loaded or appended,
+    if any."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._conn = sqlite3.connect(filename)
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        columns = [row[1] for row in
+                   self._conn.execute("PRAGMA table_info(generations)")]
+        if "parent" not in columns:
+            self._conn.close()
+            raise ValueError("{0} was written by an older robogen".format(filename))
+        # id of the Generation the next appended one descends from
+        self._parent = None
+
+    def append_generation(self, generation, match_results=None):
+        """Records a scored Generation and any match results not yet recorded.
+
+        match_results is a dict of MatchCache key: (player 1 score, player 2 score)."""
+
+        with self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO generations (num, parent, genome_version, saved) "
+                "VALUES (?, ?, ?, ?)",
+                (generation.num, self._parent, genome.GENOME_VERSION, time.time()))
+            gen_id = cursor.lastrowid
+            rows = []
+            for position, individual in enumerate(generation.population):
+                encoded = genome.encode_individual(individual)
+                rows.append((gen_id, position, individual.genome_hash(),
+                             sqlite3.Binary(pickle.dumps(encoded, pickle.HIGHEST_PROTOCOL)),
+                             individual.score, individual.score_bounds[0],
+                             individual.score_bounds[1], individual.gens_as_elite,
+                             individual.origin, ",".join(individual.parents)))
+            self._conn.executemany(
+                "INSERT INTO individuals VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            if match_results:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO matches VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [key + result + (gen_id,)
+                     for key, result in match_results.iteritems()])
+        self._parent = gen_id
+
+    def generation_nums(self):
+        """Returns the numbers of all recorded Generations, in order, once each
+        however many branches recorded them."""
+
+        return [row[0] for row in self._conn.execute(
+            "SELECT DISTINCT num FROM generations ORDER BY num")]
+
+    def lineage(self, num=None):
+        """Returns the (id, num) of a recorded Generation, by default the latest
+        one, and of each Generation it descends from, newest first.
+
+        Generation numbers recorded by several branches mean the latest one."""
+
+        row = self._find(num)
+        result = []
+        while row is not None:
+            gen_id, gen_num, parent, version = row
+            result.append((gen_id, gen_num))
+            row = self._conn.execute(
+                "SELECT id, num, parent, genome_version FROM generations "
+                "WHERE id = ?", (parent,)).fetchone()
+        return result
+
+    def load_generation(self, num=None):
+        """Rebuilds a recorded Generation, by default the latest one, and makes
+        it the parent of the next appended Generation.
+
+        Generation numbers recorded by several branches load the latest one.
+        Returns None if there is no such Generation."""
+
+        row = self._find(num)
+        if row is None:
+            return None
+        gen_id, num, parent, version = row
+        population = [pickle.loads(str(data)) for (data,) in self._conn.execute(
+            "SELECT genome FROM individuals WHERE generation = ? ORDER BY position",
+            (gen_id,))]
+        self._parent = gen_id
+        return genome.decode_generation((version, num, population))
+
+    def _find(self, num):
+        """Returns (id, num, parent, genome version) of the latest recorded
+        Generation with the given number, or of the latest one if num is None.
+
+        Returns None if there is no such Generation."""
+
+        if num is None:
+            return self._conn.execute(
+                "SELECT id, num, parent, genome_version FROM generations "
+                "ORDER BY id DESC LIMIT 1").fetchone()
+        return self._conn.execute(
+            "SELECT id, num, parent, genome_version FROM generations "
+            "WHERE num = ? ORDER BY id DESC LIMIT 1", (num,)).fetchone()
+
+    def close(self):
+        self._conn.close()
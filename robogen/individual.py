@@ -1,4 +1,5 @@
 import random
+import hashlib
 
 import rules
 
@@ -8,10 +9,17 @@ class Individual:
     mut_types = ("INS_PAR", "INS_CHI", "DEL_NOD", "DEL_BRA", "FLP_OP",
                  "FLP_NOP", "SWP_NOD", "SWP_BRA", "CHG_DIR", "CHI_ORD",
                  "EVL_ORD")
+    origin_types = ("NEW", "LO_MUT", "HI_MUT", "CROSS")
+    
+    # Lineage: how this Individual was made and the genome hashes of its parents.
+    # Also the defaults for Individuals saved before lineage was kept.
+    origin = "NEW"
+    parents = ()
 
     def __init__(self):
         
         self.score = 0
+        self.score_bounds = (0, 0)
         self.gens_as_elite = 0
         self.move_rule = rules.Rule('move')
         self.attack_rule = rules.Rule('attack')
@@ -26,14 +34,13 @@ class Individual:
         self.hp = 50
         self.robot_id = 0
         
-        self.future_moves = []
-        self.future_attacks = []
-        self.future_moves_turn = -1
+    def get_robot(self, decisions=None):
+        """Creates Robot that behaves according to this Individual's rules.
         
-    def get_robot(self):
-        """Creates Robot that behaves according to this Individual's rules."""
+        Robots given the same DecisionBuffer share their decisions each turn.
+        By default the Robot gets a DecisionBuffer of its own."""
         
-        return Robot(self)
+        return Robot(self, decisions)
         
     def make_copy(self):
         """Creates a deep copy of this Individual."""
@@ -56,6 +63,24 @@ class Individual:
         
         return result
         
+    def genome_hash(self):
+        """Hashes this Individual's Rules in evaluation order.
+        
+        Individuals with the same hash play identically, whatever their score
+        or history."""
+        
+        key = tuple(rule.genome_key() for rule in self.eval_order)
+        return hashlib.sha1(repr(key)).hexdigest()
+        
+    def simplify(self, max_nodes=None):
+        """Removes Nodes that never affect behavior from every Rule, then trims
+        Rules still bigger than max_nodes, if given."""
+        
+        for rule in self.eval_order:
+            rule.simplify()
+            if max_nodes is not None:
+                rule.limit_size(max_nodes)
+        
     @staticmethod
     def cross(one, other):
         """Creates a cross of two Individuals."""
@@ -154,10 +179,10 @@ class Individual:
                 child.parent = nd2
         
         # Swap node_list membership
-        rule1.node_list.remove(nd1)
-        rule2.node_list.remove(nd2)
-        rule1.node_list.append(nd2)
-        rule2.node_list.append(nd1)
+        rule1.remove_node(nd1)
+        rule2.remove_node(nd2)
+        rule1.add_node(nd2)
+        rule2.add_node(nd1)
 
     @staticmethod
     def swap_branches(first, second):
@@ -344,12 +369,15 @@ class Individual:
 class Robot(Individual):
     """This class defines a single Robot based on the given Individual's rules."""
 
-    def __init__(self, individual):
+    def __init__(self, individual, decisions=None):
         self.location = (9, 9)
         self.player_id = 0
         self.hp = 50
         self.robot_id = 0
         
+        if decisions is None:
+            decisions = DecisionBuffer()
+        self.decisions = decisions
         self.parent = individual
         self.move_rule = individual.move_rule
         self.attack_rule = individual.attack_rule
@@ -363,15 +391,13 @@ class Robot(Individual):
         action = []
         
         # Reset decision-sharing fields at start of each turn
-        if game['turn'] != self.parent.future_moves_turn:
-            self.parent.future_moves = [[0]*19 for i in range(19)]
-            self.parent.future_attacks = [[0]*19 for i in range(19)]
-            self.parent.future_moves_turn = game['turn']
+        decisions = self.decisions
+        decisions.start_turn(game['turn'])
         
         # Evaluate rules given the game state
         for rule in self.parent.eval_order:
-            result = rule.evaluate(game, self, self.parent.future_moves,
-                                   self.parent.future_attacks)
+            result = rule.evaluate(game, self, decisions.future_moves,
+                                   decisions.future_attacks)
             
             if result[0]:
                 for x in range(1, len(result)):
@@ -382,17 +408,51 @@ class Robot(Individual):
             
         # Set directions if needed and inform decision-sharing fields
         if action[0] == 'move':
-            dest = action[1]
-            self.parent.future_moves[dest[0]][dest[1]] = self.hp
+            decisions.set_move(action[1], self.hp)
         elif action[0] == 'attack':
-            dest = action[1]
-            self.parent.future_attacks[dest[0]][dest[1]] = True
-            self.parent.future_moves[self.location[0]][self.location[1]] = self.hp
+            decisions.set_attack(action[1])
+            decisions.set_move(self.location, self.hp)
         else:
-            self.parent.future_moves[self.location[0]][self.location[1]] = self.hp
+            decisions.set_move(self.location, self.hp)
             
         return action
         
     def debug_print(self):
         self.parent.debug_print()
-            
\ No newline at end of file
+            
+
+class DecisionBuffer:
+    """Decisions a Player's robots have made so far this turn.
+    
+    future_moves holds the HP of the robot that will end the turn at each
+    location and future_attacks marks attacked locations. A buffer belongs to
+    one Player in one match, not to the Individual, so it's never pickled with
+    a genome. Its rows are allocated once, and when the turn changes only the
+    cells written during the last turn are cleared."""
+    
+    def __init__(self):
+        self.future_moves = [[0]*19 for i in range(19)]
+        self.future_attacks = [[0]*19 for i in range(19)]
+        self.turn = -1
+        self._written = []
+        
+    def start_turn(self, turn):
+        """Clears the previous turn's decisions, unless turn is still current."""
+        
+        if turn == self.turn:
+            return
+        future_moves = self.future_moves
+        future_attacks = self.future_attacks
+        for x, y in self._written:
+            future_moves[x][y] = 0
+            future_attacks[x][y] = 0
+        del self._written[:]
+        self.turn = turn
+        
+    def set_move(self, loc, hp):
+        self.future_moves[loc[0]][loc[1]] = hp
+        self._written.append(loc)
+        
+    def set_attack(self, loc):
+        self.future_attacks[loc[0]][loc[1]] = True
+        self._written.append(loc)
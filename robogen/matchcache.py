@@ -0,0 +1,66 @@
+import cPickle as pickle
+import hashlib
+
+
+class MatchCache:
+    """Results of games already played, keyed by everything that decides them.
+
+    A key is (player 1 hash, player 2 hash, match seed, map hash). Individuals
+    are hashed with Individual.genome_hash() and coded bots by their source, so
+    a game is only ever played once for a given pairing, seed and map."""
+
+    def __init__(self):
+        self.results = {}
+
+    @staticmethod
+    def make_key(player1_hash, player2_hash, seed, map_hash):
+        return (player1_hash, player2_hash, str(seed), map_hash)
+
+    @staticmethod
+    def hash_text(text):
+        """Hashes the source of a coded bot or map."""
+
+        return hashlib.sha1(text).hexdigest()
+
+    def get(self, key):
+        return self.results.get(key)
+
+    def update(self, results):
+        """Adds a dict of key: (player 1 score, player 2 score) results."""
+
+        self.results.update(results)
+
+    def results_for(self, player_hash):
+        """Returns the results of every known game the given player was in."""
+
+        return dict((key, result) for key, result in self.results.iteritems()
+                    if key[0] == player_hash or key[1] == player_hash)
+
+    def prune(self, player_hashes, seeds=None):
+        """Forgets games involving any Individual not in player_hashes, and if
+        seeds are given, games played with any other seed.
+
+        Games against coded bots are kept if the bot's hash is included."""
+
+        keep = set(player_hashes)
+        keep_seeds = set(str(seed) for seed in seeds) if seeds is not None else None
+        self.results = dict((key, result) for key, result in self.results.iteritems()
+                            if key[0] in keep and key[1] in keep and
+                            (keep_seeds is None or key[2] in keep_seeds))
+
+    def save(self, filename):
+        try:
+            pickle.dump(self.results, open(filename, "wb"), pickle.HIGHEST_PROTOCOL)
+        except IOError:
+            print "Could not save", filename
+
+    @staticmethod
+    def load(filename):
+        """Loads a saved MatchCache, or returns an empty one if there is none."""
+
+        cache = MatchCache()
+        try:
+            cache.results = pickle.load(open(filename, "rb"))
+        except (IOError, EOFError, pickle.UnpicklingError):
+            pass
+        return cache
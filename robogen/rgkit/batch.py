@@ -0,0 +1,302 @@
+"""Plays many games in lockstep, resolving each turn for all of them at once.
+
+Robots of every game are held in (n_games, board_size, board_size) NumPy
+arrays. Bots are still asked for their actions game by game, but movement,
+collisions and damage are resolved for all games with a few array passes.
+The per-game random streams (attack damage, spawn locations and seeds) are
+drawn exactly as GameState draws them, so as long as bots don't rely on
+shared global state a BatchGame ends in the same states as playing each game
+with Game.
+
+Requires NumPy, which the rest of rgkit does not. robogen's scoring does not
+use it; it is a standalone engine for playing many games of fixed bots.
+"""
+import random
+
+import numpy as np
+
+from rgkit import rg
+from rgkit.game import CAPTURE_NONE
+from rgkit.gamestate import GameState, _CELLS, _INDEX, _LOCS
+from rgkit.settings import settings
+
+# action codes
+_GUARD, _MOVE, _ATTACK, _SUICIDE = range(1, 5)
+_ACTION_CODES = {'guard': _GUARD, 'move': _MOVE, 'attack': _ATTACK,
+                 'suicide': _SUICIDE}
+
+# _NEIGHBORS[idx] = cells around idx, where off-board neighbors are _CELLS
+_NEIGHBORS = np.array([[_INDEX.get(loc, _CELLS) for loc in rg._locs_around(l)]
+                       for l in _LOCS], dtype=np.int64)
+
+
+class BatchGame(object):
+    def __init__(self, players, seeds, symmetric=True):
+        """
+        players -- list of player lists, one per game. A Player (and a robot
+                   sharing decisions with others) must not be shared between
+                   games.
+        seeds -- match seed of each game, as passed to Game
+        """
+        assert len(players) == len(seeds)
+        self._players = players
+        for game_players in players:
+            for i, player in enumerate(game_players):
+                player.set_player_id(i)
+                # outputs are not kept, so there is nothing to capture
+                player.set_capture(CAPTURE_NONE)
+        self.seeds = [str(seed) for seed in seeds]
+        self._random = [random.Random(seed) for seed in self.seeds]
+        self._symmetric = symmetric
+        self.turn = 0
+
+        # one GameState per game, which owns that game's random streams and
+        # is what the game's players see
+        self._states = [GameState(use_start=True, seed=seed,
+                                  symmetric=symmetric)
+                        for seed in self.seeds]
+
+        n = len(seeds)
+        size = settings.board_size
+        self.hp = np.zeros((n, size, size), dtype=np.int64)
+        self.player_id = np.full((n, size, size), -1, dtype=np.int64)
+        self.robot_id = np.zeros((n, size, size), dtype=np.int64)
+        for g, state in enumerate(self._states):
+            self.hp[g].flat[:] = state._hp
+            self.player_id[g].flat[:] = state._player
+            self.robot_id[g].flat[:] = state._robot_id
+
+        spawn = np.zeros(_CELLS, dtype=bool)
+        spawn[[_INDEX[loc] for loc in settings.spawn_coords]] = True
+        self._spawn_mask = spawn
+
+    def _get_actions(self):
+        """Asks each game's bots for their actions.
+
+        Returns (kind, target) arrays of shape (n_games, cells)."""
+        n = len(self._states)
+        cells, kinds, targets = [], [], []
+        for g, state in enumerate(self._states):
+            offset = g * _CELLS
+            for player in self._players[g]:
+                seed = self._random[g].randint(0, settings.max_seed)
+                actions = player.get_responses(state, seed)[0]
+                for loc, action in actions.items():
+                    cells.append(offset + _INDEX[loc])
+                    kinds.append(_ACTION_CODES[action[0]])
+                    targets.append(_INDEX[action[1]] if len(action) > 1
+                                   else 0)
+        kind = np.zeros(n * _CELLS, dtype=np.int64)
+        target = np.zeros(n * _CELLS, dtype=np.int64)
+        kind[cells] = kinds
+        target[cells] = targets
+        return kind.reshape(n, _CELLS), target.reshape(n, _CELLS)
+
+    @staticmethod
+    def _get_movement(cell, dest, moving, at, n_cells):
+        """Resolves movement for robots of all games, as
+        GameState._get_movement does.
+
+        cell and dest are indexes into all games' cells, and at maps those
+        cells to robot numbers (-1 for no robot).
+
+        Returns (blocked, stuck, count, swap, in_way) where stuck marks
+        robots _get_movement finds stuck, count is the number of
+        robots heading to each cell and in_way is the robot at each robot's
+        destination (-1 for none)."""
+        count = np.bincount(dest, minlength=n_cells)
+        in_way = at[dest]
+        has_robot = in_way >= 0
+        other = np.where(has_robot, in_way, 0)
+        swap = moving & has_robot & (dest[other] == cell)
+        blocked = moving & ((count[dest] > 1) | swap)
+        # robots moving into a blocked robot's square are blocked too
+        while True:
+            newly = moving & ~blocked & has_robot & blocked[other]
+            if not newly.any():
+                break
+            blocked |= newly
+        stuck = blocked | (~moving & (count[cell] > 1))
+        return blocked, stuck, count, swap, in_way
+
+    @staticmethod
+    def _get_collision_counts(cell, dest, player, stuck, count, swap, in_way,
+                              n_cells):
+        """Counts the enemies each robot collides with, as
+        GameState._get_movement does."""
+        players = settings.player_count
+        per_player = np.bincount(dest * players + player,
+                                 minlength=n_cells * players)
+        has_robot = in_way >= 0
+        other = np.where(has_robot, in_way, 0)
+        enemy_in_way = has_robot & (player[other] != player) & (dest != cell)
+        # collide with the stuck robot in the way, or with everyone else
+        # heading to the same square
+        partners = np.where(has_robot & stuck[other], enemy_in_way,
+                            count[dest] - per_player[dest * players + player])
+        # stuck robots also collide with everyone heading into them
+        partners += np.where(
+            stuck, count[cell] - per_player[cell * players + player], 0)
+        # a swapping pair was counted from both sides
+        partners -= swap & enemy_in_way
+        return partners
+
+    def _get_attack_damage(self, order, kind):
+        """Draws attack damage from each game's attack random stream, in the
+        same robot order as GameState._get_damage_map."""
+        damage = np.zeros(len(kind), dtype=np.int64)
+        is_attack = (kind == _ATTACK).tolist()
+        attack_range = settings.attack_range
+        for robots, state in zip(order, self._states):
+            for robot in robots:
+                if is_attack[robot]:
+                    damage[robot] = state._attack_random.randint(
+                        *attack_range)
+        return damage
+
+    @staticmethod
+    def _get_damage_taken(game, idx, player, kind, target, end, damage,
+                          n_games):
+        """Attack and suicide damage taken by each robot at its end cell, as
+        GameState.get_delta applies from _get_damage_map."""
+        players = settings.player_count
+        # damage is totalled per (game, cell or off board, attacking player)
+        width = _CELLS + 1
+
+        attackers = np.flatnonzero(kind == _ATTACK)
+        suiciders = np.flatnonzero(kind == _SUICIDE)
+        attack_keys = ((game[attackers] * width + target[attackers]) *
+                       players + player[attackers])
+        suicide_keys = ((game[suiciders, None] * width +
+                         _NEIGHBORS[idx[suiciders]]) * players +
+                        player[suiciders, None]).ravel()
+        keys = np.concatenate([attack_keys, suicide_keys])
+        values = np.concatenate([
+            damage[attackers],
+            np.full(len(suicide_keys), settings.suicide_damage,
+                    dtype=np.int64)])
+
+        size = n_games * width * players
+        full = np.bincount(keys, weights=values, minlength=size)
+        half = np.bincount(keys, weights=values // 2, minlength=size)
+        # guards take half damage from each attacker
+        totals = np.where((kind == _GUARD)[:, None],
+                          half.reshape(-1, players)[game * width + end],
+                          full.reshape(-1, players)[game * width + end])
+        own = totals[np.arange(len(kind)), player]
+        return (totals.sum(axis=1) - own).astype(np.int64)
+
+    def run_turn(self):
+        n = len(self._states)
+        kind_grid, target_grid = self._get_actions()
+        n_cells = n * _CELLS
+
+        # robots of all games, in board order within each game
+        game, idx = np.nonzero(self.player_id.reshape(n, _CELLS) >= 0)
+        cell = game * _CELLS + idx
+        hp = self.hp.reshape(n_cells)[cell]
+        player = self.player_id.reshape(n_cells)[cell]
+        robot_id = self.robot_id.reshape(n_cells)[cell]
+        kind = kind_grid.reshape(n_cells)[cell]
+        target = target_grid.reshape(n_cells)[cell]
+
+        at = np.full(n_cells, -1, dtype=np.int64)
+        at[cell] = np.arange(len(cell))
+        # each game's robot numbers in the order its GameState visits them
+        at_list = at.tolist()
+        order = [[at_list[g * _CELLS + robot_idx]
+                  for robot_idx in state._locs.itervalues()]
+                 for g, state in enumerate(self._states)]
+        moving = kind == _MOVE
+        dest = np.where(moving, game * _CELLS + target, cell)
+
+        blocked, stuck, count, swap, in_way = self._get_movement(
+            cell, dest, moving, at, n_cells)
+        end = np.where(blocked, idx, dest - game * _CELLS)
+        collisions = self._get_collision_counts(
+            cell, dest, player, stuck, count, swap, in_way, n_cells)
+        damage = self._get_attack_damage(order, kind)
+        taken = self._get_damage_taken(game, idx, player, kind, target, end,
+                                       damage, n)
+
+        hp_end = hp - taken
+        hp_end -= np.where(kind != _GUARD,
+                           collisions * settings.collision_damage, 0)
+        hp_end[kind == _SUICIDE] = 0
+        spawning = self.turn % settings.spawn_every == 0
+        if spawning:
+            hp_end[self._spawn_mask[end]] = 0
+        alive = hp_end > 0
+
+        new_cell = game[alive] * _CELLS + end[alive]
+        new_hp = np.zeros(n_cells, dtype=np.int64)
+        new_player = np.full(n_cells, -1, dtype=np.int64)
+        new_robot_id = np.zeros(n_cells, dtype=np.int64)
+        new_hp[new_cell] = hp_end[alive]
+        new_player[new_cell] = player[alive]
+        new_robot_id[new_cell] = robot_id[alive]
+        new_hp = new_hp.reshape(n, _CELLS)
+        new_player = new_player.reshape(n, _CELLS)
+        new_robot_id = new_robot_id.reshape(n, _CELLS)
+
+        end_list = end.tolist()
+        alive_list = alive.tolist()
+
+        hp_lists = new_hp.tolist()
+        player_lists = new_player.tolist()
+        robot_id_lists = new_robot_id.tolist()
+        spawned = []
+        states = []
+        for g, state in enumerate(self._states):
+            next_robot_id = state._next_robot_id
+            # survivors, then spawns, as GameState.apply_delta adds them
+            occupied = [end_list[robot] for robot in order[g]
+                        if alive_list[robot]]
+            if spawning:
+                spawn_locations = state._get_spawn_locations()
+                for i in range(settings.spawn_per_player):
+                    for player_id in range(settings.player_count):
+                        spawn_idx = _INDEX[spawn_locations[
+                            player_id * settings.spawn_per_player + i]]
+                        hp_lists[g][spawn_idx] = settings.robot_hp
+                        player_lists[g][spawn_idx] = player_id
+                        robot_id_lists[g][spawn_idx] = next_robot_id
+                        occupied.append(spawn_idx)
+                        spawned.append((g, spawn_idx, player_id,
+                                        next_robot_id))
+                        next_robot_id += 1
+            new_state = GameState(next_robot_id=next_robot_id,
+                                  turn=self.turn + 1,
+                                  seed=state._spawn_random.randint(
+                                      0, settings.max_seed),
+                                  symmetric=self._symmetric)
+            new_state.set_arrays(hp_lists[g], player_lists[g],
+                                 robot_id_lists[g], occupied)
+            states.append(new_state)
+
+        if spawned:
+            spawn_game, spawn_idx, spawn_player, spawn_id = zip(*spawned)
+            new_hp[spawn_game, spawn_idx] = settings.robot_hp
+            new_player[spawn_game, spawn_idx] = spawn_player
+            new_robot_id[spawn_game, spawn_idx] = spawn_id
+
+        self._states = states
+        self.hp = new_hp.reshape(self.hp.shape)
+        self.player_id = new_player.reshape(self.player_id.shape)
+        self.robot_id = new_robot_id.reshape(self.robot_id.shape)
+        self.turn += 1
+
+    def run_all_turns(self):
+        assert self.turn == 0
+        while self.turn < settings.max_turns:
+            self.run_turn()
+
+    def get_state(self, game):
+        """Returns the current GameState of the given game."""
+        return self._states[game]
+
+    def get_scores(self):
+        """Returns the scores of every game, as Game.get_scores would."""
+        return [np.bincount(self.player_id[g][self.player_id[g] >= 0],
+                            minlength=settings.player_count).tolist()
+                for g in range(len(self._states))]
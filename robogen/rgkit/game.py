@@ -21,6 +21,17 @@ sys.modules['rg'] = rg  # preserve backwards compatible robot imports
 # Iterating global seed to speed up Player.get_responses
 glb_seed = 0
 
+# Output capture policies of a Player:
+# CAPTURE_NONE -- bot output is not redirected or recorded
+# CAPTURE_TURN -- output is redirected once per turn and split between bots
+# CAPTURE_ACTION -- output is redirected around every bot's act call
+CAPTURE_NONE, CAPTURE_TURN, CAPTURE_ACTION = 'none', 'turn', 'action'
+
+# How many turns of states, actions and history a Game retains. Any other
+# positive number keeps a ring buffer of that many turns.
+RETAIN_FULL = None
+RETAIN_FINAL = 1
+
 class NullDevice(object):
     def write(self, msg):
         pass
@@ -46,20 +57,52 @@ class Tee(object):
         self.copy.flush()
 
 
+# Compiled code objects of bot sources, by source. Compiling is nearly all of
+# the cost of loading a bot, so each source is only compiled once per process.
+_compiled_bots = {}
+
+
+def compile_bot(code):
+    """Returns the compiled code object for a bot's source code."""
+    code_object = _compiled_bots.get(code)
+    if code_object is None:
+        code_object = compile(code, '<robot>', 'exec')
+        _compiled_bots[code] = code_object
+    return code_object
+
+
+def _redirect_output(captured_output):
+    """Tees stdout and stderr into captured_output.
+
+    Returns the original streams, to be passed to _restore_output."""
+    conv = lambda s: s.encode('ascii', 'replace')
+    streams = (sys.stdout, sys.stderr)
+    sys.stdout = Tee(sys.stdout, captured_output, conv=conv)
+    sys.stderr = Tee(sys.stderr, captured_output, conv=conv)
+    return streams
+
+
+def _restore_output(streams):
+    sys.stdout, sys.stderr = streams
+
+
 class Player(object):
-    def __init__(self, file_name=None, robot=None, code=None, name=None):
+    def __init__(self, file_name=None, robot=None, code=None, name=None,
+                 capture=CAPTURE_ACTION):
         """
         One of these arguments must be provided:
         file_name -- path to file containing a robot
         robot -- instance of a robot
         code -- source code containing a robot
         name argument can be used to set robot's name
+        capture -- output capture policy, one of the CAPTURE_* constants
         """
         # The server will treat 3 invalid moves as a forfeit, so we will
         # force a forfeit by forcing suicide after 3 total invalid moves
         self._invalid_moves = 0
         
         self._player_id = None  # must be set using set_player_id
+        self._capture = capture
 
         self._code = code
         if file_name is not None:
@@ -77,8 +120,9 @@ class Player(object):
             self._name = str(robot.__class__).split('.')[-1]
             self._robot = robot
         elif self._code:
+            # a fresh module per load, so no state is kept between matches
             self._module = imp.new_module('usercode%d' % id(self))
-            exec(self._code, self._module.__dict__)
+            exec(compile_bot(self._code), self._module.__dict__)
             self._robot = self._module.Robot()
         else:
             # No way to reload robot...
@@ -87,6 +131,10 @@ class Player(object):
     def set_player_id(self, player_id):
         self._player_id = player_id
 
+    def set_capture(self, capture):
+        assert capture in (CAPTURE_NONE, CAPTURE_TURN, CAPTURE_ACTION)
+        self._capture = capture
+
     @staticmethod
     def _numeral_types():
         if sys.version_info >= (3, 0):
@@ -135,9 +183,7 @@ class Player(object):
                 robot, 'action[1][0]', action[1][0], Player._numeral_types())
             Player._validate_type(
                 robot, 'action[1][1]', action[1][1], Player._numeral_types())
-            valid_locs = rg.locs_around(
-                robot.location, filter_out=['invalid', 'obstacle'])
-            if action[1] not in valid_locs:
+            if action[1] not in rg.valid_locs_around(robot.location):
                 raise Exception(
                     'Bot {0}: {1} is not a valid action.'.format(
                         robot.robot_id, action)
@@ -148,15 +194,22 @@ class Player(object):
 
     def _get_response(self, game_state, game_info, robot, seed):
         """Returns sanitized action, output and error flag from robot"""
+        captured_output = io.BytesIO()
+        streams = None
         try:
-            exc_flag = False
-            captured_output = io.BytesIO()
-            conv = lambda s: s.encode('ascii', 'replace')
+            streams = _redirect_output(captured_output)
+            action, exc_flag = self._get_action(game_info, robot, seed)
+        finally:
+            if streams is not None:
+                _restore_output(streams)
 
-            _stdout = sys.stdout
-            _stderr = sys.stderr
-            sys.stdout = Tee(sys.stdout, captured_output, conv=conv)
-            sys.stderr = Tee(sys.stderr, captured_output, conv=conv)
+        return action, (exc_flag, captured_output.getvalue())
+
+    def _get_action(self, game_info, robot, seed):
+        """Returns sanitized action and error flag from robot, without
+        capturing its output"""
+        try:
+            exc_flag = False
 
             # random.seed(seed)
             # # Server requires knowledge of seed
@@ -190,26 +243,46 @@ class Player(object):
             #traceback.print_exc(file=sys.stderr)
             action = ['guard']
 
-        finally:
-            sys.stdout = _stdout
-            sys.stderr = _stderr
-
-        return action, (exc_flag, captured_output.getvalue())
+        return action, exc_flag
 
     def get_responses(self, game_state, seed):
         """
         Returns a tuple of two dictionaries containing actions,
-        and (error flag and output) for each bot, respectively
+        and (error flag and output) for each bot, respectively. With
+        CAPTURE_NONE the second dictionary is empty.
         """
         game_info = game_state.get_game_info(self._player_id)
         actions, outputs = {}, {}
+        own_robots = [(loc, robot) for loc, robot in game_state.robots.items()
+                      if robot.player_id == self._player_id]
 
-        for loc, robot in game_state.robots.items():
-            if robot.player_id == self._player_id:
+        if self._capture == CAPTURE_ACTION:
+            for loc, robot in own_robots:
                 # Every act call should get a different random seed
                 actions[loc], outputs[loc] = self._get_response(
                     game_state, game_info, robot,
                     seed=str(seed) + '-' + str(robot.robot_id))
+        elif self._capture == CAPTURE_TURN:
+            captured_output = io.BytesIO()
+            spans = {}
+            streams = _redirect_output(captured_output)
+            try:
+                for loc, robot in own_robots:
+                    start = captured_output.tell()
+                    actions[loc], exc_flag = self._get_action(
+                        game_info, robot,
+                        seed=str(seed) + '-' + str(robot.robot_id))
+                    spans[loc] = (exc_flag, start, captured_output.tell())
+            finally:
+                _restore_output(streams)
+            text = captured_output.getvalue()
+            for loc, (exc_flag, start, end) in spans.items():
+                outputs[loc] = (exc_flag, text[start:end])
+        else:
+            for loc, robot in own_robots:
+                actions[loc] = self._get_action(
+                    game_info, robot,
+                    seed=str(seed) + '-' + str(robot.robot_id))[0]
 
         return actions, outputs
 
@@ -220,10 +293,17 @@ class Player(object):
 class Game(object):
     def __init__(self, players, record_actions=False, record_history=False,
                  print_info=False, seed=None, quiet=0, delta_callback=None,
-                 symmetric=True):
+                 symmetric=True, capture=None, retain=RETAIN_FULL):
+        """
+        capture -- if given, output capture policy set on every player
+        retain -- number of latest turns to keep, or RETAIN_FULL for all
+        """
+        assert retain is RETAIN_FULL or retain > 0
         self._players = players
         for i, player in enumerate(self._players):
             player.set_player_id(i)
+            if capture is not None:
+                player.set_capture(capture)
         self._record_actions = record_actions
         self._record_history = record_history
         self._print_info = print_info
@@ -236,6 +316,7 @@ class Game(object):
         self._state = GameState(use_start=True, seed=self.seed,
                                 symmetric=symmetric)
 
+        self._retain = retain
         self._actions_on_turn = {}
         self._states = {}
         self.history = []  # TODO: make private
@@ -261,9 +342,19 @@ class Game(object):
 
     def _save_actions_on_turn(self, actions_on_turn, turn):
         self._actions_on_turn[turn] = actions_on_turn
+        if self._retain is not RETAIN_FULL:
+            self._actions_on_turn.pop(turn - self._retain, None)
 
     def _save_state(self, state, turn):
         self._states[turn] = state
+        if self._retain is not RETAIN_FULL:
+            self._states.pop(turn - self._retain, None)
+
+    def _save_history(self, robots):
+        self.history.append(robots)
+        if (self._retain is not RETAIN_FULL and
+                len(self.history) > self._retain):
+            del self.history[0]
 
     def _get_robots_responses(self):
         # TODO: honour quietness
@@ -369,7 +460,7 @@ class Game(object):
         self._save_state(new_state, new_state.turn)
 
         if self._record_history:
-            self.history.append(self._make_history(
+            self._save_history(self._make_history(
                 responses, record_output=record_output))
 
         self._state = new_state
@@ -387,7 +478,7 @@ class Game(object):
 
         # create last turn's state for server history
         if self._record_history:
-            self.history.append(self._make_history(({}, {})))
+            self._save_history(self._make_history(({}, {})))
 
         # create dummy data for last turn
         # TODO: render should be cleverer
@@ -1,9 +1,390 @@
 from __future__ import division
+import copy
 import random
 from collections import defaultdict
 
 from rgkit import rg
-from rgkit.settings import settings, AttrDict
+from rgkit.settings import settings, AttrDict, LOC_SPAWN
+
+
+# Robots are stored in flat arrays indexed by x * board_size + y
+_CELLS = settings.board_size * settings.board_size
+_LOCS = [(x, y) for x in range(settings.board_size)
+         for y in range(settings.board_size)]
+_INDEX = dict((loc, idx) for idx, loc in enumerate(_LOCS))
+
+
+class RobotView(object):
+    """A robot in a GameState, read from and written to the state's arrays."""
+
+    __slots__ = ('_state', '_idx')
+
+    def __init__(self, state, idx):
+        self._state = state
+        self._idx = idx
+
+    @property
+    def location(self):
+        return _LOCS[self._idx]
+
+    @property
+    def hp(self):
+        return self._state._hp[self._idx]
+
+    @hp.setter
+    def hp(self, value):
+        self._state._hp[self._idx] = value
+
+    @property
+    def player_id(self):
+        return self._state._player[self._idx]
+
+    @player_id.setter
+    def player_id(self, value):
+        self._state._player[self._idx] = value
+
+    @property
+    def robot_id(self):
+        return self._state._robot_id[self._idx]
+
+    @robot_id.setter
+    def robot_id(self, value):
+        self._state._robot_id[self._idx] = value
+
+    # dict-style access, as robots used to be AttrDicts
+    def __getitem__(self, key):
+        if key not in ('location', 'hp', 'player_id', 'robot_id'):
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __repr__(self):
+        return repr({'location': self.location, 'hp': self.hp,
+                     'player_id': self.player_id, 'robot_id': self.robot_id})
+
+
+class RobotMap(object):
+    """Read-mostly {loc: RobotView} mapping over a GameState's arrays.
+
+    Iterates robots in the order of the dict robots used to be kept in, so
+    seeded games play out as they always have."""
+
+    __slots__ = ('_state',)
+
+    def __init__(self, state):
+        self._state = state
+
+    def __len__(self):
+        return len(self._state._occupied)
+
+    def __contains__(self, loc):
+        return _INDEX.get(loc) in self._state._occupied
+
+    def __getitem__(self, loc):
+        idx = _INDEX.get(loc)
+        if idx not in self._state._occupied:
+            raise KeyError(loc)
+        return RobotView(self._state, idx)
+
+    def __delitem__(self, loc):
+        if loc not in self:
+            raise KeyError(loc)
+        self._state.remove_robot(loc)
+
+    def get(self, loc, default=None):
+        idx = _INDEX.get(loc)
+        if idx not in self._state._occupied:
+            return default
+        return RobotView(self._state, idx)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        return self._state._locs.keys()
+
+    def values(self):
+        state = self._state
+        return [RobotView(state, idx) for idx in state._locs.itervalues()]
+
+    def items(self):
+        state = self._state
+        return [(loc, RobotView(state, idx))
+                for loc, idx in state._locs.iteritems()]
+
+
+class RobotInfo(object):
+    """A robot as a player sees it in get_game_info.
+
+    Reads like the AttrDict it replaces, straight from the state's arrays,
+    and hides robot_id for enemy robots. Writing to it makes the owning
+    RobotInfoMap materialize a private copy first, so bots can never change
+    the GameState."""
+
+    __slots__ = ('_map', '_idx')
+
+    def __init__(self, robot_map, idx):
+        object.__setattr__(self, '_map', robot_map)
+        object.__setattr__(self, '_idx', idx)
+
+    def _as_dict(self):
+        copies = self._map._robot_copies
+        if copies is not None:
+            return copies[self._idx]
+        return self._map._make_robot(self._idx)
+
+    def _private(self):
+        self._map._materialize()
+        return self._map._robot_copies[self._idx]
+
+    def __getitem__(self, key):
+        copies = self._map._robot_copies
+        if copies is not None:
+            return copies[self._idx][key]
+        state = self._map._state
+        idx = self._idx
+        if key == 'location':
+            return _LOCS[idx]
+        elif key == 'hp':
+            return state._hp[idx]
+        elif key == 'player_id':
+            return state._player[idx]
+        elif (key == 'robot_id' and
+                state._player[idx] == self._map._player_id):
+            return state._robot_id[idx]
+        raise KeyError(key)
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setitem__(self, key, value):
+        self._private()[key] = value
+
+    def __setattr__(self, name, value):
+        self._private()[name] = value
+
+    def __delitem__(self, key):
+        del self._private()[key]
+
+    def __delattr__(self, name):
+        delattr(self._private(), name)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def has_key(self, key):
+        return key in self
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __iter__(self):
+        return iter(self._as_dict())
+
+    def __len__(self):
+        return len(self._as_dict())
+
+    def keys(self):
+        return self._as_dict().keys()
+
+    def values(self):
+        return self._as_dict().values()
+
+    def items(self):
+        return self._as_dict().items()
+
+    def iterkeys(self):
+        return self._as_dict().iterkeys()
+
+    def itervalues(self):
+        return self._as_dict().itervalues()
+
+    def iteritems(self):
+        return self._as_dict().iteritems()
+
+    def copy(self):
+        return AttrDict(self._as_dict())
+
+    def __copy__(self):
+        return AttrDict(self._as_dict())
+
+    def __deepcopy__(self, memo):
+        return AttrDict(self._as_dict())
+
+    def __reduce__(self):
+        return (AttrDict, (self._as_dict(),))
+
+    def __eq__(self, other):
+        if isinstance(other, RobotInfo):
+            other = other._as_dict()
+        return self._as_dict() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(self._as_dict())
+
+
+class RobotInfoMap(object):
+    """The {loc: robot} mapping a player sees in get_game_info.
+
+    A read-only view over the GameState's arrays, so no robots are copied
+    per player per turn. The first time a bot changes the mapping or one of
+    its robots, the view materializes the private dict of AttrDicts it
+    stands for and serves everything from that copy afterwards.
+
+    Iterates in the order of that dict, which is built by inserting the
+    robots in the GameState's order, so a bot sees the same order before and
+    after it writes to the view."""
+
+    __slots__ = ('_state', '_player_id', '_copy', '_robot_copies', '_order')
+
+    def __init__(self, state, player_id):
+        self._state = state
+        self._player_id = player_id
+        self._copy = None
+        self._robot_copies = None
+        self._order = None
+
+    def _make_robot(self, idx):
+        state = self._state
+        robot = AttrDict({
+            'location': _LOCS[idx],
+            'hp': state._hp[idx],
+            'player_id': state._player[idx]
+        })
+        if robot.player_id == self._player_id:
+            robot.robot_id = state._robot_id[idx]
+        return robot
+
+    def _materialize(self):
+        if self._copy is None:
+            robots = {}
+            copies = {}
+            for loc, idx in self._state._locs.iteritems():
+                robot = self._make_robot(idx)
+                copies[idx] = robot
+                robots[loc] = robot
+            self._copy = robots
+            self._robot_copies = copies
+        return self._copy
+
+    # [(loc, idx)] in the order of the dict _materialize would build
+    def _get_order(self):
+        if self._order is None:
+            order = {}
+            for loc, idx in self._state._locs.iteritems():
+                order[loc] = idx
+            self._order = order.items()
+        return self._order
+
+    def __len__(self):
+        if self._copy is not None:
+            return len(self._copy)
+        return len(self._state._occupied)
+
+    def __contains__(self, loc):
+        if self._copy is not None:
+            return loc in self._copy
+        return _INDEX.get(loc) in self._state._occupied
+
+    def has_key(self, loc):
+        return loc in self
+
+    def __getitem__(self, loc):
+        if self._copy is not None:
+            return self._copy[loc]
+        idx = _INDEX.get(loc)
+        if idx not in self._state._occupied:
+            raise KeyError(loc)
+        return RobotInfo(self, idx)
+
+    def get(self, loc, default=None):
+        if self._copy is not None:
+            return self._copy.get(loc, default)
+        idx = _INDEX.get(loc)
+        if idx not in self._state._occupied:
+            return default
+        return RobotInfo(self, idx)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        if self._copy is not None:
+            return self._copy.keys()
+        return [loc for loc, idx in self._get_order()]
+
+    def values(self):
+        if self._copy is not None:
+            return self._copy.values()
+        return [RobotInfo(self, idx) for loc, idx in self._get_order()]
+
+    def items(self):
+        if self._copy is not None:
+            return self._copy.items()
+        return [(loc, RobotInfo(self, idx)) for loc, idx in self._get_order()]
+
+    def iterkeys(self):
+        return iter(self.keys())
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def __setitem__(self, loc, robot):
+        self._materialize()[loc] = robot
+
+    def __delitem__(self, loc):
+        del self._materialize()[loc]
+
+    def pop(self, *args):
+        return self._materialize().pop(*args)
+
+    def popitem(self):
+        return self._materialize().popitem()
+
+    def setdefault(self, *args):
+        return self._materialize().setdefault(*args)
+
+    def update(self, *args, **kwargs):
+        self._materialize().update(*args, **kwargs)
+
+    def clear(self):
+        self._materialize().clear()
+
+    def copy(self):
+        return dict(self._materialize())
+
+    def __copy__(self):
+        return dict(self._materialize())
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(self._materialize(), memo)
+
+    def __reduce__(self):
+        return (dict, (self._materialize(),))
+
+    def __eq__(self, other):
+        return self._materialize() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(self._materialize())
 
 
 class GameState(object):
@@ -15,7 +396,15 @@ class GameState(object):
         self._spawn_random = random.Random(self._seed + 's')
         self._attack_random = random.Random(self._seed + 'a')
 
-        self.robots = {}
+        self._hp = [0] * _CELLS
+        self._player = [-1] * _CELLS
+        self._robot_id = [0] * _CELLS
+        self._occupied = set()
+        # {loc: idx} of every robot, added and removed exactly as robots were
+        # when they were kept in a dict. Robots are visited in its order, which
+        # decides the order of bots' act calls and of attack damage draws.
+        self._locs = {}
+        self.robots = RobotMap(self)
         self.turn = turn
         self._next_robot_id = next_robot_id
 
@@ -39,19 +428,37 @@ class GameState(object):
             robot_id = self._next_robot_id
             self._next_robot_id += 1
 
-        self.robots[loc] = AttrDict({
-            'location': loc,
-            'hp': hp,
-            'player_id': player_id,
-            'robot_id': robot_id
-        })
+        idx = _INDEX[loc]
+        self._hp[idx] = hp
+        self._player[idx] = player_id
+        self._robot_id[idx] = robot_id
+        self._occupied.add(idx)
+        self._locs[loc] = idx
 
     def remove_robot(self, loc):
         if self.is_robot(loc):
-            del self.robots[loc]
+            idx = _INDEX[loc]
+            self._player[idx] = -1
+            self._occupied.discard(idx)
+            del self._locs[loc]
 
     def is_robot(self, loc):
-        return loc in self.robots
+        return _INDEX.get(loc) in self._occupied
+
+    # replace all robots with the given flat per-cell lists, where a
+    # player_id of -1 marks an empty cell. occupied lists the robots' cells
+    # in the order add_robot would have been called for them.
+    def set_arrays(self, hp, player_id, robot_id, occupied=None):
+        if occupied is None:
+            occupied = [idx for idx, player in enumerate(player_id)
+                        if player >= 0]
+        self._hp = hp
+        self._player = player_id
+        self._robot_id = robot_id
+        self._occupied = set(occupied)
+        self._locs = {}
+        for idx in occupied:
+            self._locs[_LOCS[idx]] = idx
 
     def _get_spawn_locations_symmetric(self):
         def symmetric_loc(loc):
@@ -85,69 +492,58 @@ class GameState(object):
         self._spawn_random.shuffle(locations)
         return locations
 
-    def _get_contenders(self, dest):
+    # dest = {idx: destination idx}, for every occupied idx
+    # returns (loc_end, collisions) where loc_end = {idx: end idx} and
+    # collisions = {idx: [idx of each enemy the robot at idx collided with]}
+    def _get_movement(self, dest):
         """
-        Generates a dict of locations, where the values correspond to the
-        set of bots that wish to move into that square or will be moving
-        into that square. This is because due to collisions a bot can
-        'use up' two squares:
-        1. the first is blocked because he attempted to move into it
-        2. the second is blocked because that is his current location
-           where he will be staying due to the collision at 1
-
-        :param dest: func(location of robot) = destination of robot
-        :returns: dict[destination] = set(locations of bots that either
-                                        want to move to 'destination' or
-                                        are moving to 'destination'
-                                        because of collisions)
-        """
-        contenders = defaultdict(lambda: set())
-
-        def stuck(loc):
-            # Robot at loc is stuck
-            # Other robots trying to move in its old locations
-            # should be marked as stuck, too
-            old_contenders = contenders[loc]
-            contenders[loc] = set([loc])
-
-            for contender in old_contenders:
-                if contender != loc:
-                    stuck(contender)
-
-        for loc in self.robots:
-            contenders[dest(loc)].add(loc)
-
-        for loc in self.robots:
-            if len(contenders[dest(loc)]) > 1 or (self.is_robot(dest(loc)) and
-                                                  dest(loc) != loc and
-                                                  dest(dest(loc)) == loc):
-                # Robot at loc is going to fail to move
-                stuck(loc)
-
-        return contenders
-
-    # new_locations = {loc: new_loc}
-    def _get_new_locations(self, dest, contenders):
-        new_locations = {}
-
-        for loc in self.robots:
-            if loc != dest(loc) and loc in contenders[loc]:
-                new_locations[loc] = loc
-            else:
-                new_locations[loc] = dest(loc)
-
-        return new_locations
+        Resolves movement in one pass over the robots.
 
-    # collisions = {loc: set(robots collided with robot at loc)}
-    def _get_collisions(self, dest, contenders):
-        collisions = defaultdict(lambda: set())
+        A robot fails to move, and is stuck where it is, if another robot
+        heads for the same square, if it swaps squares with another robot or
+        if it heads into a stuck robot. A stuck robot also 'uses up' its own
+        square, so robots heading into it are stuck, too; these chains are
+        followed with a stack instead of recursion.
 
-        for loc in self.robots:
-            for loc2 in contenders[dest(loc)]:
-                collisions[loc].add(loc2)
-                collisions[loc2].add(loc)
+        A robot collides with the others heading for the same square (or
+        with the stuck robot in that square) and, if it's stuck, with every
+        robot heading into it.
+        """
+        heading = defaultdict(list)  # {idx: robots heading for idx}
+        for idx, to in dest.iteritems():
+            heading[to].append(idx)
+
+        occupied = self._occupied
+        pending = [idx for idx, to in dest.iteritems()
+                   if len(heading[to]) > 1 or
+                   (to != idx and to in occupied and dest[to] == idx)]
+        stuck = set()
+        while pending:
+            idx = pending.pop()
+            if idx not in stuck:
+                stuck.add(idx)
+                pending.extend(heading.get(idx, ()))
+
+        player = self._player
+        loc_end = {}
+        collisions = {}
+        for idx, to in dest.iteritems():
+            me = player[idx]
+            if to in stuck:
+                enemies = [to] if player[to] != me else []
+            else:
+                enemies = [other for other in heading[to]
+                           if player[other] != me]
+            if idx in stuck:
+                loc_end[idx] = idx
+                # a robot swapping with this one is already counted
+                enemies.extend(other for other in heading.get(idx, ())
+                               if other != to and player[other] != me)
+            else:
+                loc_end[idx] = to
+            collisions[idx] = enemies
 
-        return collisions
+        return loc_end, collisions
 
     # damage_map = {loc: [actor_id: (actor_loc, damage)]}
     # only counts potential attack and suicide damage
@@ -156,8 +552,8 @@ class GameState(object):
         damage_map = defaultdict(
             lambda: [{} for _ in range(settings.player_count)])
 
-        for loc, robot in self.robots.items():
-            actor_id = robot.player_id
+        for loc, idx in self._locs.iteritems():
+            actor_id = self._player[idx]
 
             if actions[loc][0] == 'attack':
                 target = actions[loc][1]
@@ -180,7 +576,7 @@ class GameState(object):
     def _apply_spawn(delta, spawn_locations):
         # clear robots on spawn
         for robot_delta in delta:
-            if robot_delta.loc_end in settings.spawn_coords:
+            if rg.loc_mask(robot_delta.loc_end) & LOC_SPAWN:
                 robot_delta.hp_end = 0
 
         # spawn robots
@@ -209,25 +605,25 @@ class GameState(object):
     def get_delta(self, actions, spawn=True):
         delta = []
 
-        def dest(loc):
-            if actions[loc][0] == 'move':
-                return actions[loc][1]
-            else:
-                return loc
+        dest = {}
+        for idx in self._occupied:
+            action = actions[_LOCS[idx]]
+            dest[idx] = _INDEX[action[1]] if action[0] == 'move' else idx
 
-        contenders = self._get_contenders(dest)
-        new_locations = self._get_new_locations(dest, contenders)
-        collisions = self._get_collisions(dest, contenders)
+        loc_end, collisions = self._get_movement(dest)
         damage_map = self._get_damage_map(actions)
         damage_caused = defaultdict(lambda: 0)  # {loc: damage_caused}
 
-        for loc, robot in self.robots.items():
+        robot_player = self._player
+        for loc, idx in self._locs.iteritems():
+            hp = self._hp[idx]
+            player = robot_player[idx]
             robot_delta = AttrDict({
                 'loc': loc,
-                'hp': robot.hp,
-                'player_id': robot.player_id,
-                'loc_end': new_locations[loc],
-                'hp_end': robot.hp,  # to be adjusted
+                'hp': hp,
+                'player_id': player,
+                'loc_end': _LOCS[loc_end[idx]],
+                'hp_end': hp,  # to be adjusted
                 'damage_caused': 0  # to be adjusted
             })
 
@@ -237,15 +633,14 @@ class GameState(object):
             if not is_guard:
                 damage = settings.collision_damage
 
-                for other_loc in collisions[loc]:
-                    if robot.player_id != self.robots[other_loc].player_id:
-                        robot_delta.hp_end -= damage
-                        damage_caused[other_loc] += damage
+                for other in collisions[idx]:
+                    robot_delta.hp_end -= damage
+                    damage_caused[_LOCS[other]] += damage
 
             # attack and suicide damage
             for player_id, player_damage_map in enumerate(
-                    damage_map[new_locations[loc]]):
-                if player_id != robot.player_id:
+                    damage_map[robot_delta.loc_end]):
+                if player_id != player:
                     for actor_loc, damage in player_damage_map.items():
                         if is_guard:
                             damage //= 2
@@ -289,7 +684,7 @@ class GameState(object):
 
                 # is this a new robot?
                 if delta_info.hp > 0:
-                    robot_id = self.robots[loc].robot_id
+                    robot_id = self._robot_id[_INDEX[loc]]
                 else:
                     robot_id = None
 
@@ -309,8 +704,8 @@ class GameState(object):
     def get_scores(self):
         scores = [0 for _ in range(settings.player_count)]
 
-        for robot in self.robots.values():
-            scores[robot.player_id] += 1
+        for idx in self._occupied:
+            scores[self._player[idx]] += 1
 
         return scores
 
@@ -318,11 +713,16 @@ class GameState(object):
     def get_game_info(self, player_id):
         game_info = AttrDict()
 
-        game_info.robots = dict((loc, AttrDict(robot))
-                                for loc, robot in self.robots.items())
-        for robot in game_info.robots.values():
-            if robot.player_id != player_id:
-                del robot.robot_id
+        # a view hiding enemy robot_ids, copied only if a bot writes to it
+        game_info.robots = RobotInfoMap(self, player_id)
+
+        # player_grid[x][y] is the player id of the robot at (x, y), or -1,
+        # and hp_grid[x][y] its hp, so lookups by location need no dict
+        size = settings.board_size
+        game_info.player_grid = [self._player[x * size:(x + 1) * size]
+                                 for x in range(size)]
+        game_info.hp_grid = [self._hp[x * size:(x + 1) * size]
+                             for x in range(size)]
 
         game_info.turn = self.turn
 
@@ -378,7 +378,7 @@ class Render(object):
         self.update_block_size()
 
     def get_bg_color(self, loc):
-        if loc in settings.obstacles:
+        if loc in settings.obstacle_set:
             return rgb_to_hex(*render_settings.obstacle_color)
         return rgb_to_hex(*render_settings.normal_color)
 
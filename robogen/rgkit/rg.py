@@ -1,4 +1,4 @@
-from rgkit.settings import settings
+from rgkit.settings import settings, LOC_TYPE_BITS, LOC_OBSTACLE, LOC_INVALID
 
 
 CENTER_POINT = (int(settings.board_size / 2), int(settings.board_size / 2))
@@ -26,18 +26,27 @@ def memodict(f):
     return memoize(f)
 
 
-@memoize
-def loc_types(loc):
-    for i in range(2):
-        if not 0 <= loc[i] < settings.board_size:
-            return set(['invalid'])
+# type names of each combination of location type bits
+_MASK_NAMES = [frozenset(name for name, bit in LOC_TYPE_BITS if mask & bit)
+               for mask in range(16)]
+_NAME_BITS = dict(LOC_TYPE_BITS)
+
+
+def _names_mask(names):
+    bits = 0
+    for name in names:
+        bits |= _NAME_BITS.get(name, 0)
+    return bits
+
 
-    types = set(['normal'])
-    if loc in settings.spawn_coords:
-        types.add('spawn')
-    if loc in settings.obstacles:
-        types.add('obstacle')
-    return types
+def loc_mask(loc):
+    """Returns the LOC_* bits of loc's types."""
+    return settings.loc_masks.get(loc, LOC_INVALID)
+
+
+def loc_types(loc):
+    """Returns the (frozen) set of loc's type names. loc_mask() is faster."""
+    return _MASK_NAMES[settings.loc_masks.get(loc, LOC_INVALID)]
 
 
 @memoize
@@ -48,9 +57,22 @@ def _locs_around(loc):
 
 
 def locs_around(loc, filter_out=None):
-    filter_out = set(filter_out or [])
+    if not filter_out:
+        return list(_locs_around(loc))
+    bits = _names_mask(filter_out)
+    masks = settings.loc_masks
     return [a_loc for a_loc in _locs_around(loc)
-            if len(filter_out & loc_types(a_loc)) == 0]
+            if not masks.get(a_loc, LOC_INVALID) & bits]
+
+
+def valid_locs_around(loc):
+    """Returns the locations around loc that aren't invalid or obstacles, as
+    locs_around(loc, filter_out=('invalid', 'obstacle')) does, but as a
+    precomputed tuple."""
+    neighbors = settings.valid_neighbors.get(loc)
+    if neighbors is None:
+        return tuple(locs_around(loc, filter_out=('invalid', 'obstacle')))
+    return neighbors
 
 
 def _sign(x):
@@ -69,12 +91,12 @@ def toward(curr, dest):
     move_x = (x0 + _sign(x_diff), y0)
 
     if abs(y_diff) > abs(x_diff):
-        if move_y not in settings.obstacles:
+        if not loc_mask(move_y) & LOC_OBSTACLE:
             return move_y
         else:
             return move_x
     else:
-        if move_x not in settings.obstacles:
+        if not loc_mask(move_x) & LOC_OBSTACLE:
             return move_x
         else:
             return move_y
@@ -161,7 +161,7 @@ Cursor right    d, <right>"""
         state = self._game.get_state(self._turn)
         for r in range(settings.board_size):
             for c in range(settings.board_size):
-                if (r, c) in settings.obstacles:
+                if (r, c) in settings.obstacle_set:
                     self._draw_grid_obstacle(r, c)
                 elif state.is_robot((r, c)):
                     robot = state.robots[(r, c)]
@@ -183,7 +183,7 @@ Cursor right    d, <right>"""
         actions = self._game._actions_on_turn[self._turn]
         r, c = self._selected
         s = "Selected: " + str((r, c))
-        if (r, c) in settings.obstacles:
+        if (r, c) in settings.obstacle_set:
             s += "\nObstacle"
         elif state.is_robot((r, c)):
             robot = state.robots[(r, c)]
@@ -28,16 +28,36 @@ from rgkit import game
 from rgkit.game import Player
 
 
+# {absolute map path: (modification time, map data, compiled map)}
+_map_cache = {}
+
+
+def load_map(map_filepath, settings=default_settings):
+    """Returns (map data, compiled map) of the map file, reading and compiling
+    it only the first time it's used or after it's been changed."""
+    path = os.path.abspath(map_filepath)
+    mtime = os.path.getmtime(path)
+    entry = _map_cache.get(path)
+    if entry is None or entry[0] != mtime:
+        map_data = ast.literal_eval(open(path).read())
+        entry = (mtime, map_data, settings.compile_map(map_data))
+        _map_cache[path] = entry
+    return entry[1], entry[2]
+
+
 class Options(object):
     def __init__(self, map_filepath=None, headless=False, print_info=False,
                  animate_render=False, play_in_thread=False, curses=False,
                  game_seed=None, match_seeds=None, quiet=0, symmetric=True,
-                 n_of_games=1, start=0):
+                 n_of_games=1, start=0, capture=None):
 
         if map_filepath is None:
             map_filepath = os.path.join(os.path.dirname(__file__),
                                         'maps/default.py')
         self.animate_render = animate_render
+        # Bot output capture policy, see game.CAPTURE_*. None picks one from
+        # headless and quiet.
+        self.capture = capture
         self.curses = curses
         self.game_seed = game_seed
         self.headless = headless
@@ -52,6 +72,7 @@ class Options(object):
 
     def __eq__(self, other):
         return (self.animate_render == other.animate_render and
+                self.capture == other.capture and
                 self.curses == other.curses and
                 self.game_seed == other.game_seed and
                 self.headless == other.headless and
@@ -76,9 +97,10 @@ class Runner(object):
         if players is None:
             players = []
 
-        self._map_data = ast.literal_eval(open(options.map_filepath).read())
+        self._map_data, compiled_map = load_map(options.map_filepath,
+                                                settings)
         self.settings = settings
-        self.settings.init_map(self._map_data)
+        self.settings.init_map(self._map_data, compiled_map)
         # Players can only be initialized from file after initializing settings
         if player_files is not None:
             for player_file in player_files:
@@ -90,7 +112,8 @@ class Runner(object):
             self._names.append(player.name())
         self.options = options
 
-        if Runner.is_multiprocessing_supported():
+        # only curses needs a lock, and making one is costly
+        if options.curses and Runner.is_multiprocessing_supported():
             import multiprocessing
             self._rgcurses_lock = multiprocessing.Lock()
         else:
@@ -185,25 +208,46 @@ class Runner(object):
     
         return scores
 
+    def _capture_policy(self):
+        """Bot output is only captured if it could be shown or saved."""
+        if self.options.capture is not None:
+            return self.options.capture
+        if self.options.headless and self.options.quiet >= 4:
+            return game.CAPTURE_NONE
+        return game.CAPTURE_ACTION
+
+    def _retain_policy(self):
+        """Past turns are only kept if something could look at them."""
+        if (self.options.headless and not self.options.curses and
+                self._delta_callback is None):
+            return game.RETAIN_FINAL
+        return game.RETAIN_FULL
+
     def play(self, match_seed):
+        capture = self._capture_policy()
+        retain = self._retain_policy()
         if self.options.play_in_thread:
             g = game.ThreadedGame(self._players,
                                   print_info=self.options.print_info,
                                   record_actions=not self.options.headless,
-                                  record_history=True,
+                                  record_history=retain is game.RETAIN_FULL,
                                   seed=match_seed,
                                   quiet=self.options.quiet,
                                   delta_callback=self._delta_callback,
-                                  symmetric=self.options.symmetric)
+                                  symmetric=self.options.symmetric,
+                                  capture=capture,
+                                  retain=retain)
         else:
             g = game.Game(self._players,
                           print_info=self.options.print_info,
                           record_actions=not self.options.headless,
-                          record_history=True,
+                          record_history=retain is game.RETAIN_FULL,
                           seed=match_seed,
                           quiet=self.options.quiet,
                           delta_callback=self._delta_callback,
-                          symmetric=self.options.symmetric)
+                          symmetric=self.options.symmetric,
+                          capture=capture,
+                          retain=retain)
 
         if not self.options.headless and not self.options.curses:
             # only import render if we need to render the game;
@@ -247,6 +291,40 @@ class Runner(object):
         return is_multiprocessing_supported
 
 
+def play_match(player1, player2, seed, map_filepath=None, symmetric=True,
+               settings=default_settings):
+    """Plays one headless game and returns its scores.
+
+    For callers playing very many games: no Options or Runner is made, nothing
+    is rendered or printed, bot output is not captured and only the final turn
+    is kept. Players may be Players or robots, and Players are reloaded first.
+
+    Unlike Runner.run, the global random module is seeded from the match seed
+    for the game and restored afterwards, so bots drawing from it play the
+    same game every time and the same players, seed and map always give the
+    same scores. Runner.run plays the same game for the same match seed only
+    if the bots don't draw from the global random module.
+    """
+    if map_filepath is None:
+        map_filepath = Runner.default_map()
+    settings.init_map(*load_map(map_filepath, settings))
+    players = []
+    for player in (player1, player2):
+        if not isinstance(player, Player):
+            player = Player(robot=player)
+        player.load()
+        players.append(player)
+    g = game.Game(players, seed=seed, symmetric=symmetric,
+                  capture=game.CAPTURE_NONE, retain=game.RETAIN_FINAL)
+    random_state = random.getstate()
+    random.seed(str(seed))
+    try:
+        g.run_all_turns()
+    finally:
+        random.setstate(random_state)
+    return g.get_scores()
+
+
 def _task(arg):
     return Runner.from_command_line_args(arg).run()
 
@@ -1,3 +1,12 @@
+# location type bits of Settings.loc_masks
+LOC_NORMAL = 1
+LOC_SPAWN = 2
+LOC_OBSTACLE = 4
+LOC_INVALID = 8
+LOC_TYPE_BITS = (('normal', LOC_NORMAL), ('spawn', LOC_SPAWN),
+                 ('obstacle', LOC_OBSTACLE), ('invalid', LOC_INVALID))
+
+
 class AttrDict(dict):
     def __init__(self, *args, **kwargs):
         super(AttrDict, self).__init__(*args, **kwargs)
@@ -7,12 +16,58 @@ class AttrDict(dict):
 class Settings(AttrDict):
     def __init__(self, *args, **kwargs):
         super(Settings, self).__init__(*args, **kwargs)
+        # {loc: LOC_* bits} of every board location, off-board locations
+        # are LOC_INVALID
+        self.loc_masks = {}
+        # {loc: tuple of the locations around loc a robot can move to}
+        self.valid_neighbors = {}
 
-    def init_map(self, map_data):
+    def init_map(self, map_data, compiled=None):
+        """Makes map_data the current map.
+
+        compiled is what compile_map(map_data) returns, if it's known. Doesn't
+        do anything if map_data is already the current map."""
+        if map_data is self.get('map_data'):
+            return
+        if compiled is None:
+            compiled = self.compile_map(map_data)
+        self.map_data = map_data
         self.spawn_coords = map_data['spawn']
         self.obstacles = map_data['obstacle']
         self.player_count = map_data.get('player_count', 2)
         self.start = map_data.get('start', None)
+        self.spawn_set = compiled.spawn_set
+        self.obstacle_set = compiled.obstacle_set
+        # the tables are updated in place, so references to them stay current
+        self.loc_masks.clear()
+        self.loc_masks.update(compiled.loc_masks)
+        self.valid_neighbors.clear()
+        self.valid_neighbors.update(compiled.valid_neighbors)
+
+    def compile_map(self, map_data):
+        """Returns the lookup structures init_map derives from map_data."""
+        spawn_set = frozenset(tuple(loc) for loc in map_data['spawn'])
+        obstacle_set = frozenset(tuple(loc) for loc in map_data['obstacle'])
+
+        size = self.board_size
+        masks = {}
+        for x in range(size):
+            for y in range(size):
+                masks[(x, y)] = LOC_NORMAL
+        for loc in spawn_set:
+            masks[loc] |= LOC_SPAWN
+        for loc in obstacle_set:
+            masks[loc] |= LOC_OBSTACLE
+
+        blocked = LOC_OBSTACLE | LOC_INVALID
+        neighbors = {}
+        for (x, y) in masks:
+            neighbors[(x, y)] = tuple(
+                loc for loc in ((x, y + 1), (x + 1, y), (x, y - 1), (x - 1, y))
+                if not masks.get(loc, LOC_INVALID) & blocked)
+
+        return AttrDict(spawn_set=spawn_set, obstacle_set=obstacle_set,
+                        loc_masks=masks, valid_neighbors=neighbors)
 
 
 settings = Settings({
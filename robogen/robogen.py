@@ -1,33 +1,42 @@
 import time
 import os
+import math
 import sys
 import cPickle as pickle
 import argparse
+import signal
 from argparse import RawTextHelpFormatter
 from multiprocessing.pool import Pool
 from multiprocessing.process import Process
 import threading
-import Queue
-import msvcrt
 import cProfile, pstats, StringIO
 
 from rgkit import run as rgrun
-from rgkit.game import Player
+from rgkit.game import Player, compile_bot
 
 from generation import Generation
+import genome
+from matchcache import MatchCache
+from history import HistoryStore
+from distributed import Coordinator, run_worker, parse_address, make_authkey
+from control import Controller
 import constants
 
 
-progress_q = Queue.Queue(maxsize=1)
-early_end_q = Queue.Queue(maxsize=1)
+controller = Controller()
 
 class ProgressInfo:
     
-    def __init__(self, scores=[], gen=0, last_backup=0, save_file=None):
+    def __init__(self, scores=[], gen=0, last_backup=0, save_file=None, workers=None,
+                 authkey=None):
         self.scores = scores
         self.gen = gen
         self.last_backup = last_backup
         self.save_file = save_file
+        # Number of connected remote workers, if scoring is distributed
+        self.workers = workers
+        # Secret remote workers connect with, if scoring is distributed
+        self.authkey = authkey
     
 
 def get_arg_parser():
@@ -40,19 +49,41 @@ def get_arg_parser():
     parser.add_argument("-s", "--save_file",
                         help="File to save last Generation to.",
                         default=constants.default_save)
+    parser.add_argument("--history",
+                        help="SQLite file every scored Generation is appended to.",
+                        default=constants.default_history)
+    parser.add_argument("--resume", type=int, metavar="GEN",
+                        help="Resume from a Generation recorded in the history file. "
+                             "Later Generations already recorded are kept as another branch.",
+                        default=None)
     parser.add_argument("-g", "--gens", type=int,
                         help="Number of generations to run.",
                         default=1)
     parser.add_argument("-p", "--processes", type=int,
                         help="Number of worker processes allowed to run simultaneously.",
                         default=constants.default_cpu_count)
+    parser.add_argument("--serve", metavar="HOST:PORT",
+                        help="Distribute scoring games to workers that connect to this address.",
+                        default=None)
+    parser.add_argument("--connect", metavar="HOST:PORT",
+                        help="Run (processes) workers for the robogen serving at this address.\n"
+                             "Workers need the same rgkit/bots as the server.",
+                        default=None)
+    parser.add_argument("--authkey",
+                        help="Shared secret of the server and its workers. Required to connect.\n"
+                             "A server without one makes a random one and shows it.",
+                        default=None)
+    parser.add_argument("--task_timeout", type=float,
+                        help="Seconds before a remote worker's game is given to another worker.",
+                        default=constants.task_timeout)
     return parser
     
 def save_generation(generation, filename):
     if len(filename) <= 2 or filename[len(filename)-2: len(filename)] != ".p":
         filename = filename + ".p"
     try:
-        pickle.dump(generation, open(filename, "wb"))
+        pickle.dump(genome.encode_generation(generation), open(filename, "wb"),
+                    pickle.HIGHEST_PROTOCOL)
     except IOError:
         print "Could not save", filename
         sys.exit(1)
@@ -62,6 +93,9 @@ def load_generation(filename):
         filename = filename + ".p"
     try:
         generation = pickle.load(open(filename, "rb"))
+        # Saves from before the genome encoding are pickled Generations
+        if not isinstance(generation, Generation):
+            generation = genome.decode_generation(generation)
         print "Resuming from", filename
         print "Last Generation Processed:", generation.num
         score_str = "Sorted Scores"
@@ -75,128 +109,292 @@ def load_generation(filename):
         generation.populate()
         return generation
 
-def initial_score_individuals(args):
+# Source of each coded opponent bot as (name, code, hash). Loaded once per process.
+coded_opponents = None
+# Hash of each map file used, by path
+map_hashes = {}
 
-    individual = args[0]
-    gen = args[1]
-    options = rgrun.Options()
-    options.headless = True
-    options.quiet = 10
-    options.n_of_games = constants.games_per_scoring
-    individual.score = 0
-    players = [Player(robot=individual.get_robot()), None]
-    
-    folder = os.getcwd()
-    folder = os.path.join(folder, "rgkit", "bots")
-    
-    # AS PLAYER 1
-    # Play against the coded bots
-    for file_name in os.listdir(folder):
-        loc_path = os.path.join("rgkit", "bots", file_name)
-        #print "\t\tOpponent:", file_name
-        try:
-            players[1] = Player(file_name=loc_path)
-        except IOError:
-            print "Error opening", loc_path
-            sys.exit(1)
-        results = rgrun.Runner(players=players, options=options).run()
-        individual.score += sum(p1 > p2 for p1, p2 in results)
-        
-    # Play against other elites in generation
-    is_elite = (gen.population.index(individual) < constants.elite_size)
-    if is_elite:
-        individual.score += 1       # Free win for being in elite
-        for elite_idx in range(constants.elite_size):
-            if individual is not gen.population[elite_idx]:
-                players[1] = Player(name="individual",
-                                    robot=gen.population[elite_idx].get_robot())
-                results = rgrun.Runner(players=players, options=options).run()
-                individual.score += sum(p1 > p2 for p1, p2 in results)
-    else:
-        # No free win for non-elite contenders
-        for elite_idx in range(constants.elite_size):
-            players[1] = Player(name="individual",
-                                robot=gen.population[elite_idx].get_robot())
-            results = rgrun.Runner(players=players, options=options).run()
-            individual.score += sum(p1 > p2 for p1, p2 in results)
-            
-    # AS PLAYER 2
-    players = [None, Player(robot=individual.get_robot())]
-    # Play against the coded bots
-    for file_name in os.listdir(folder):
-        loc_path = os.path.join("rgkit", "bots", file_name)
-        #print "\t\tOpponent:", file_name
-        try:
-            players[0] = Player(file_name=loc_path)
-        except IOError:
-            print "Error opening", loc_path
-            sys.exit(1)
-        results = rgrun.Runner(players=players, options=options).run()
-        individual.score += sum(p2 > p1 for p1, p2 in results)
-        
-    # Play against other elites in generation
-    is_elite = (gen.population.index(individual) < constants.elite_size)
-    if is_elite:
-        individual.score += 1       # Free win for being in elite
-        for elite_idx in range(constants.elite_size):
-            if individual is not gen.population[elite_idx]:
-                players[0] = Player(name="individual",
-                                    robot=gen.population[elite_idx].get_robot())
-                results = rgrun.Runner(players=players, options=options).run()
-                individual.score += sum(p2 > p1 for p1, p2 in results)
-    else:
-        # No free win for non-elite contenders
-        for elite_idx in range(constants.elite_size):
-            players[0] = Player(name="individual",
-                                robot=gen.population[elite_idx].get_robot())
-            results = rgrun.Runner(players=players, options=options).run()
-            individual.score += sum(p2 > p1 for p1, p2 in results)
-        
-    return individual.score
+def get_coded_opponents():
+    """Returns the coded opponent bots in rgkit/bots, reading them if needed."""
+    
+    global coded_opponents
+    if coded_opponents is None:
+        coded_opponents = []
+        folder = os.path.join(os.getcwd(), "rgkit", "bots")
+        for file_name in os.listdir(folder):
+            if os.path.splitext(file_name)[1] != ".py":
+                continue
+            loc_path = os.path.join("rgkit", "bots", file_name)
+            try:
+                with open(loc_path) as bot_file:
+                    code = bot_file.read()
+            except IOError:
+                print "Error opening", loc_path
+                sys.exit(1)
+            coded_opponents.append((os.path.splitext(file_name)[0], code,
+                                    MatchCache.hash_text(code)))
+    return coded_opponents
+    
+def get_map_hash(map_filepath):
+    """Returns the hash of a map file, reading it if needed."""
+    
+    if map_filepath not in map_hashes:
+        map_hashes[map_filepath] = MatchCache.hash_text(open(map_filepath).read())
+    return map_hashes[map_filepath]
+    
+def get_entrant(individual):
+    """Returns the (hash, encoded genome) entrant of an Individual in a schedule."""
+    
+    return (individual.genome_hash(), genome.encode_individual(individual))
+    
+def get_coded_entrants():
+    """Returns the (hash, None) entrants of the coded bots in a schedule."""
+    
+    return [(code_hash, None) for name, code, code_hash in get_coded_opponents()]
+    
+def make_player(entrant):
+    """Creates a Player for an entrant of a schedule."""
+    
+    entrant_hash, encoded = entrant
+    if encoded is not None:
+        individual = genome.decode_individual(encoded)
+        return Player(name="individual", robot=individual.get_robot())
+    for name, code, code_hash in get_coded_opponents():
+        if code_hash == entrant_hash:
+            return Player(code=code, name=name)
+    raise KeyError(entrant_hash)
+    
+def get_game_seed(game_num, game_seed=None):
+    """Returns the match seed of a scoring game, as rgkit's Runner makes it."""
+    
+    return str(game_seed) + '-' + str(game_num)
+    
+def get_schedule(gen_num):
+    """Returns the game numbers of every scoring game of a Generation.
+    
+    All Individuals of a Generation play each opponent with the same match
+    seeds, so they meet the same spawns and attack rolls and their scores
+    differ only by how they play. The window of games moves on by one game
+    each Generation, so no Individual is bred for a single set of games, while
+    a surviving elite has only one new game to play against each opponent."""
+    
+    return range(gen_num, gen_num + constants.games_per_scoring)
+    
+def get_game_key(player1, player2, game_num, map_hash, game_seed=None):
+    """Returns the MatchCache key of a scoring game between two entrants."""
+    
+    return MatchCache.make_key(player1[0], player2[0],
+                               get_game_seed(game_num, game_seed), map_hash)
+    
+def init_worker():
+    """Warms up a pool worker so every task it runs can skip setup."""
+    
+    # Loads the map into rgkit's settings
+    rgrun.Runner()
+    # Reads and compiles every coded bot once
+    for name, code, code_hash in get_coded_opponents():
+        compile_bot(code)
+
+def init_pool_worker():
+    """init_worker() for the local Pool, whose workers leave Ctrl+C to the
+    main process so it can stop gracefully."""
+    
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    init_worker()
+
+def play_game(game):
+    """Plays a (player 1 entrant, player 2 entrant, game number) game.
+    
+    Returns (MatchCache key, (player 1 score, player 2 score))."""
+    
+    player1, player2, game_num = game
+    map_filepath = rgrun.Runner.default_map()
+    result = rgrun.play_match(make_player(player1), make_player(player2),
+                              get_game_seed(game_num), map_filepath)
+    map_hash = get_map_hash(map_filepath)
+    return get_game_key(player1, player2, game_num, map_hash), tuple(result)
+    
+def schedule_games(pairings, game_nums, match_cache, map_hash):
+    """Plans the games of every pairing, each played once.
+    
+    Each (A, B) pairing plays game_nums with A and B in both seats. Games
+    already in match_cache, or planned for an earlier pairing (such as (B, A)),
+    are left out. Returns the planned games for play_game()."""
+    
+    planned = set()
+    games = []
+    for first, second in pairings:
+        for game_num in game_nums:
+            for player1, player2 in ((first, second), (second, first)):
+                key = get_game_key(player1, player2, game_num, map_hash)
+                if key in planned or match_cache.get(key) is not None:
+                    continue
+                planned.add(key)
+                games.append((player1, player2, game_num))
+    return games
+    
+def play_schedule(pairings, game_nums, individual_pool, match_cache, map_hash):
+    """Plays every game of the pairings not yet in match_cache and adds their
+    results to match_cache.
+    
+    Every game is its own task, handed to whichever worker is free next, so the
+    pool stays busy however many games there are and however long each runs."""
+    
+    games = schedule_games(pairings, game_nums, match_cache, map_hash)
+    for key, result in individual_pool.imap_unordered(play_game, games, chunksize=1):
+        match_cache.update({key: result})
+    
+def score_bounds(wins, games, total_games, free_wins, looks=1):
+    """Returns (low, high) bounds on the score of an Individual that has won
+    (wins) of the first (games) of its (total_games) scoring games.
+    
+    Bounds use Hoeffding's inequality on the win rate of the remaining games,
+    and never go past losing or winning all of them. When the bounds are
+    checked (looks) times as games come in, each check gets an equal share of
+    1 - constants.racing_confidence, so by the union bound they hold at every
+    check together with probability constants.racing_confidence."""
+    
+    score = free_wins + wins
+    remaining = total_games - games
+    if remaining <= 0:
+        return (score, score)
+    low = score
+    high = score + remaining
+    if games > 0:
+        rate = float(wins) / games
+        margin = math.sqrt(math.log(2.0 * looks / (1.0 - constants.racing_confidence)) /
+                           (2.0 * games))
+        low = max(low, score + remaining * max(0.0, rate - margin))
+        high = min(high, score + remaining * min(1.0, rate + margin))
+    return (low, high)
+    
+def still_racing(racing, bounds, num_elites):
+    """Returns the Individuals of racing that can still make the elite.
+    
+    racing holds indexes into bounds, the (low, high) score bounds of the
+    whole population. An Individual is out once its high bound is below the
+    (num_elites)th best low bound."""
+    
+    lows = sorted([low for low, high in bounds], reverse=True)
+    cutoff = lows[num_elites - 1]
+    return [x for x in racing if bounds[x][1] >= cutoff]
+    
+def race_individuals(population, individual_pool, match_cache, game_nums):
+    """Scores the population by racing, returning each Individual's score.
+    
+    Every Individual still in the race plays one game against each opponent in
+    each seat per round. After each round, any Individual whose upper score bound
+    is below the lower bound of the (constants.elite_size)th best cannot make the
+    elite and stops playing. Its score is then projected from its win rate. The
+    rest finish the full schedule and get exact scores.
+    
+    Each round's games are scheduled together, so games between two elites are
+    only played once and shared by both. Rounds play game_nums in order, from
+    get_schedule().
+    
+    Bounds are corrected for being checked after every round but the last, so
+    with few games per scoring they rarely stop anybody."""
     
-def break_ties(args):
+    elites = population[:constants.elite_size]
+    entrants = [get_entrant(x) for x in population]
+    coded_entrants = get_coded_entrants()
+    map_hash = get_map_hash(rgrun.Options().map_filepath)
+    opponents = []
+    free_wins = []
+    for x in range(len(population)):
+        is_elite = any(population[x] is elite for elite in elites)
+        # An elite does not play itself, but gets a free win in each seat
+        opponents.append(coded_entrants +
+                         [entrants[y] for y in range(len(elites))
+                          if population[y] is not population[x]])
+        free_wins.append(2 if is_elite else 0)
+    total_games = [2 * len(game_nums) * len(x) for x in opponents]
+    wins = [0] * len(population)
+    games = [0] * len(population)
+    
+    looks = max(1, len(game_nums) - 1)
+    racing = range(len(population))
+    for game_num in game_nums:
+        pairings = [(entrants[x], opponent) for x in racing
+                    for opponent in opponents[x]]
+        play_schedule(pairings, [game_num], individual_pool, match_cache, map_hash)
+        for x in racing:
+            for opponent in opponents[x]:
+                # AS PLAYER 1
+                p1, p2 = match_cache.get(get_game_key(entrants[x], opponent,
+                                                      game_num, map_hash))
+                wins[x] += (p1 > p2)
+                # AS PLAYER 2
+                p1, p2 = match_cache.get(get_game_key(opponent, entrants[x],
+                                                      game_num, map_hash))
+                wins[x] += (p2 > p1)
+                games[x] += 2
+            population[x].score_bounds = score_bounds(wins[x], games[x],
+                                                      total_games[x], free_wins[x],
+                                                      looks)
+        racing = still_racing(racing, [x.score_bounds for x in population],
+                              constants.elite_size)
+    
+    scores = []
+    for x in range(len(population)):
+        if games[x] >= total_games[x]:
+            scores.append(free_wins[x] + wins[x])
+        else:
+            scores.append(free_wins[x] + total_games[x] * float(wins[x]) / games[x])
+    return scores
+    
+def break_ties(tied_individuals, individual_pool, match_cache, game_nums):
     """Breaks ties between a group of Individuals by pitting them against each other.
     
-    In case of an absolute tie, the 'most elite' is favored.
-    
-    This fills half of a matrix of scores. If we know A's score in (A vs B), then
-    we can determine B's score in (B vs A) without making them compete a second time."""
-    
-    individual = args[0]
-    tied_individuals = args[1]
-    individual_idx = args[2]
-    options = rgrun.Options()
-    options.headless = True
-    options.quiet = 10
-    options.n_of_games = constants.games_per_scoring
-    players = [Player(robot=individual.get_robot()), None]
-    results = []
-    
-    # AS PLAYER 1
-    # Play against other elites in generation
-    for x in range(individual_idx+1, len(tied_individuals)):
-        opponent = tied_individuals[x]
-        players[1] = Player(name="individual", robot=opponent.get_robot())
-        result = rgrun.Runner(players=players, options=options).run()
-        results.append(sum(p1 >= p2 for p1, p2 in result))
-            
-    # AS PLAYER 2
-    players = [None, Player(robot=individual.get_robot())]
-    # Play against other elites in generation
-    for x in range(individual_idx+1, len(tied_individuals)):
-        opponent = tied_individuals[x]
-        players[0] = Player(name="individual", robot=opponent.get_robot())
-        result = rgrun.Runner(players=players, options=options).run()
-        results.append(sum(p2 >= p1 for p1, p2 in result))
-    
-    return results
+    In case of an absolute tie, the 'most elite' is favored: a drawn game counts
+    as a win for whichever Individual comes first in tied_individuals.
+    
+    Every pairing is scheduled once, with both seats, and each Individual's new
+    score is read from the shared results. New scores are in the range
+    [tie score, tie score + 1)."""
+    
+    base_score = tied_individuals[0].score
+    entrants = [get_entrant(x) for x in tied_individuals]
+    map_hash = get_map_hash(rgrun.Options().map_filepath)
+    num_individuals = len(tied_individuals)
+    pairings = [(entrants[x], entrants[y]) for x in range(num_individuals)
+                for y in range(x + 1, num_individuals)]
+    play_schedule(pairings, game_nums, individual_pool, match_cache, map_hash)
+    
+    for x in range(num_individuals):
+        sub_score = 0
+        for y in range(num_individuals):
+            if x == y:
+                continue
+            for game_num in game_nums:
+                # AS PLAYER 1
+                p1, p2 = match_cache.get(get_game_key(entrants[x], entrants[y],
+                                                      game_num, map_hash))
+                sub_score += (p1 >= p2) if x < y else (p1 > p2)
+                # AS PLAYER 2
+                p1, p2 = match_cache.get(get_game_key(entrants[y], entrants[x],
+                                                      game_num, map_hash))
+                sub_score += (p2 >= p1) if x < y else (p2 > p1)
+        
+        # New score is 'normalized' to be 0 <= x < 1
+        sub_score = (sub_score / (2.0 * num_individuals * len(game_nums)))
+        tied_individuals[x].score = base_score + sub_score
         
 def worker(args):
 
     # Init
     gen = None
     last_backup = 0
-    if args.load_file is not None:
+    history = HistoryStore(args.history)
+    if args.resume is not None:
+        gen = history.load_generation(args.resume)
+        if gen is None:
+            history.close()
+            raise ValueError("Generation {0} is not in {1}".format(args.resume,
+                                                                   args.history))
+        last_backup = gen.num
+        gen = gen.propagate()
+    elif args.load_file is not None:
         gen = load_generation(args.load_file)
         last_backup = gen.num
         gen = gen.propagate()
@@ -204,18 +402,43 @@ def worker(args):
         gen = Generation()
         gen.populate()
     save_file = args.save_file
+    match_cache = MatchCache.load(constants.default_cache)
+    
+    # One pool of warm workers serves every generation. When serving, remote
+    # workers take the pool's place.
+    if args.serve is not None:
+        individual_pool = Coordinator(parse_address(args.serve), args.authkey,
+                                      args.task_timeout)
+    else:
+        individual_pool = Pool(processes=args.processes, initializer=init_pool_worker)
+    try:
+        run_generations(args, gen, last_backup, save_file, individual_pool,
+                        match_cache, history)
+    finally:
+        individual_pool.close()
+        individual_pool.join()
+        history.close()
+        
+def run_generations(args, gen, last_backup, save_file, individual_pool,
+                    match_cache, history):
+    
+    workers = None
+    coded_hashes = [code_hash for name, code, code_hash in get_coded_opponents()]
     
     # For each generation
     for gen_num in range(1, args.gens+1):
     
         # INITIAL SCORING
-        # Individual VS Elites and Coded Bots
-        individual_pool = Pool(processes=args.processes)
-        scores = individual_pool.map(initial_score_individuals, 
-                                     [(x, gen) for x in gen.population])
+        # Individual VS Elites and Coded Bots, raced so that Individuals out of
+        # elite contention stop early
+        # Only games of this Generation's schedule can be needed again
+        game_nums = get_schedule(gen.num)
+        hashes = [x.genome_hash() for x in gen.population]
+        match_cache.prune(hashes + coded_hashes,
+                          [get_game_seed(game_num) for game_num in game_nums])
+        scores = race_individuals(gen.population, individual_pool, match_cache,
+                                  game_nums)
         sorted_scores = []
-        individual_pool.close()
-        individual_pool.join()
         for x in range(len(gen.population)):
             gen.population[x].score = scores[x]
             sorted_scores.append(gen.population[x].score)
@@ -232,124 +455,114 @@ def worker(args):
                 if individual.score == tie_score:
                     tied_individuals.append(individual)
             # Break The Ties
-            individual_pool = Pool(processes=args.processes)
-            partial_scores = individual_pool.map(break_ties, 
-                               [(tied_individuals[x], tied_individuals, x) 
-                               for x in range(len(tied_individuals))])
-            individual_pool.close()
-            individual_pool.join()
-            # New scores are in range [tie_score, tie_score+1)
-            fill_scores_from_partial(tied_individuals, partial_scores)
+            break_ties(tied_individuals, individual_pool, match_cache, game_nums)
 
             scores = []
             for x in range(len(gen.population)):
                 scores.append(gen.population[x].score)
         gen.sort_by_score()
-        
-        # Clobber if necessary
-        try:
-            progress_q.get_nowait()
-        except Queue.Empty:
-            pass
+        history.append_generation(gen, match_cache.results)
+        if isinstance(individual_pool, Coordinator):
+            workers = individual_pool.num_workers
         
         # If work is done or early stop is requested: save, inform, finish
-        if gen_num == args.gens or not early_end_q.empty():
-            progress_q.put(ProgressInfo(scores, gen.num, last_backup, save_file))
+        if gen_num == args.gens or controller.stop_requested():
             save_generation(gen, save_file)
+            match_cache.save(constants.default_cache)
+            controller.post_progress(ProgressInfo(scores, gen.num, last_backup,
+                                                  save_file, workers, args.authkey))
             break
         # Otherwise: inform and move to next generation
         else:
             if (gen_num % constants.backup_frequency) == (constants.backup_frequency-1):
                 save_generation(gen, constants.default_backup)
+                match_cache.save(constants.default_cache)
                 last_backup = gen.num
-            progress_q.put(ProgressInfo(scores, gen.num, last_backup))
+            controller.post_progress(ProgressInfo(scores, gen.num, last_backup,
+                                                  workers=workers,
+                                                  authkey=args.authkey))
             gen = gen.propagate()
             
-def fill_scores_from_partial(tied_individuals, partial_scores):
-    """Creates a full score matrix from a half-full one.
-    
-    Each Individual is pitted (constants.games_per_scoring) times against all other
-    Individuals that come after the Individual in tied_individuals. This fills half of a
-    matrix such that (A vs B) is known, but (B vs A) is unknown. However, (B vs A) is 
-    just (constants.games_per_scoring - (A vs B)).
-    
-    This is only to be used in tandem with break_ties()."""
-    
-    base_score = tied_individuals[0].score
-    
-    num_individuals = len(tied_individuals)
-    for x in range(num_individuals):
-        sub_score = 0
-        # Add in known scores
-        for y in range((num_individuals - 1 - x)):
-            # As Player 1
-            sub_score += partial_scores[x][y]
-            # As Player 2
-            sub_score += partial_scores[x][y + (num_individuals-1-x)]
-        # Add in unknown scores. Note: partial_scores is not actual a half-empty
-        #     matrix. It is an array of arrays of decreasing size. Thus the complicated
-        #     indices.
-        for y in range(x):
-            # As Player 1
-            sub_score += (constants.games_per_scoring - partial_scores[y][x - (y+1)])
-            # As Player 2
-            sub_score += (constants.games_per_scoring - 
-                                 partial_scores[y][x - (y+1) + (num_individuals-1-y)])
-        
-        # New score is 'normalized' to be 0 <= x < 1
-        sub_score = (sub_score / (2.0 * len(tied_individuals) * constants.games_per_scoring))
-        tied_individuals[x].score = base_score + sub_score
-                        
-
 def main():
 
     # Get args: load or new; number of generations; TODO: More options
-    args = get_arg_parser().parse_args()
+    parser = get_arg_parser()
+    args = parser.parse_args()
+    
+    # Connections unpickle what they receive, so a well known secret would let
+    # anybody who can reach the server run code on it or on its workers
+    if args.connect is not None and args.authkey is None:
+        parser.error("--connect needs the --authkey shown by the server")
+    if args.serve is not None and args.authkey is None:
+        args.authkey = make_authkey()
+    
+    if args.connect is not None:
+        run_remote_workers(args)
+        return
     
     clear()
-    if args.load_file is not None:
+    if args.resume is not None:
+        print "Resuming from generation", args.resume, "of", args.history, ". . ."
+    elif args.load_file is not None:
         # The printout for this is in the load_generation method
         pass
     else:
         print "Starting evolution from scratch . . ."
+    if args.serve is not None:
+        print "Serving at", args.serve, "\tWorkers connect with: --authkey", args.authkey
         
+    controller.install_signal_handlers()
+    controller.start_key_reader()
+    # A daemon, so that a second stop signal can exit without waiting for it
     work_thread = threading.Thread(target=worker, args=(args,))
+    work_thread.daemon = True
     work_thread.start()
-    gen = 0
-    scores = []
     progress = None
+    stopping = False
     
-    # Status Printing Loop until work finished or SPACE pressed
-    ended_naturally = False
-    while not msvcrt.kbhit() or msvcrt.getch() != " ":
-        # Each finished generation fills the progress_q
-        try:
-            progress = progress_q.get_nowait()
-            if progress.save_file is not None:
-                ended_naturally = True
-                break
-        except Queue.Empty:
-            pass
-        print_status(progress)
-        time.sleep(1)
-    # If SPACE was pressed, inform work thread through early_end_q
-    if not ended_naturally:
-        progress = ProgressInfo()
-        clear()
-        print "Gracefully exiting and saving progress.\nPlease wait",
-        early_end_q.put(ProgressInfo(save_file=True))
-        # Wait for work thread to save progress
-        while progress.save_file is None:
-            try:
-                print ".",
-                progress = progress_q.get_nowait()
-                print ""  # Get rid of a left over space from the above printout
-            except Queue.Empty:
-                time.sleep(1)
-
-    work_thread.join()
+    # Status Printing Loop until work finished. Redrawn on every event, and
+    # every second to spin the spinner.
+    try:
+        while progress is None or progress.save_file is None:
+            event = controller.next_event(1.0)
+            if event is None:
+                if not work_thread.is_alive():
+                    break
+                if stopping:
+                    print ".",
+                else:
+                    print_status(progress)
+                continue
+            kind, value = event
+            if kind == "progress":
+                progress = value
+                if not stopping:
+                    print_status(progress)
+            elif kind == "stop" and not stopping:
+                # The work thread saves after the Generation it's scoring
+                stopping = True
+                clear()
+                print "Gracefully exiting and saving progress.\nPlease wait",
+        if stopping:
+            print ""  # Get rid of a left over space from the above printout
+        work_thread.join()
+    finally:
+        controller.close()
     print_status(progress)
 
+def run_remote_workers(args):
+    """Runs (args.processes) workers for the robogen serving at args.connect.
+    
+    Each worker keeps reconnecting until the server tells it to stop."""
+    
+    address = parse_address(args.connect)
+    print "Working for", args.connect, "with", args.processes, "processes"
+    processes = [Process(target=run_worker, args=(address, args.authkey, init_worker))
+                 for x in range(args.processes)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
     
 spinner = 0
 def print_status(progress):
@@ -373,6 +586,9 @@ def print_status(progress):
         print "Execution finished. Progress saved in", progress.save_file
     print "Last Generation Processed:", progress.gen,
     print "\tLast Backup Generation:", progress.last_backup
+    if progress.workers is not None:
+        print "Connected Workers:", progress.workers,
+        print "\tWorkers connect with: --authkey", progress.authkey
     max_score = (2.0 * constants.games_per_scoring * 
                  (constants.elite_size + constants.num_coded_opponents)) + 1.0
     scores = []
@@ -388,7 +604,7 @@ def print_status(progress):
         score_str = score_str + " : {:.1f}".format(score)
     print score_str
     if progress.save_file is None:
-        print "Press Spacebar to save progress and exit."
+        print "Press Spacebar or Ctrl+C to save progress and exit."
         
 def clear():
     os.system('cls' if os.name == 'nt' else 'clear')
@@ -1,15 +1,51 @@
 import time
 import os
+import copy
+import pickle
 import random
+from multiprocessing import Process
 
 from rgkit import run as rgrun
-from rgkit.game import Player
+from rgkit import rg
+from rgkit.game import Player, Game
 from rgkit.gamestate import GameState
+from rgkit.settings import settings, AttrDict
+try:
+    from rgkit.batch import BatchGame
+except ImportError:
+    # BatchGame needs NumPy
+    BatchGame = None
 
 from individual import Individual
 from rules import Node
+from distributed import Coordinator, run_worker, make_authkey
+import robogen
 import constants
 
+
+view_game_info = GameState.__dict__['get_game_info']
+
+def eager_game_info(state, player_id):
+    """get_game_info as it was before robots became a view: a fresh dict of
+    AttrDicts, filled in the GameState's robot order."""
+    
+    game_info = view_game_info(state, player_id)
+    robots = {}
+    for loc, robot in state.robots.items():
+        robots[loc] = AttrDict({'location': loc, 'hp': robot.hp,
+                                'player_id': robot.player_id,
+                                'robot_id': robot.robot_id})
+        if robot.player_id != player_id:
+            del robots[loc].robot_id
+    game_info.robots = robots
+    return game_info
+
+def slow_task(arg):
+    """A Coordinator task that takes long enough for its worker to be killed."""
+    
+    time.sleep(0.5)
+    return arg * 2
+
 class Test:
     """Test Suite for Individuals' behavior."""
 
@@ -74,7 +110,7 @@ class Test:
         player2 = Individual()
         testee = player1.get_robot()
         testee.location = constants.testee_loc
-        ally = player1.get_robot()
+        ally = player1.get_robot(testee.decisions)
         ally.location = constants.ally_loc
         enemy = player2.get_robot()
         enemy.location = constants.enemy_loc
@@ -640,6 +676,252 @@ class Test:
         
         print "PASSED"
         
+    def test_compiled_rules(self):
+        """Verifies compiled Rules match the interpreted Node tree walk.
+        
+        Random Individuals are evaluated against random game states, and
+        mutated between rounds to check that stale compiled Rules are rebuilt.
+        """
+        
+        print "-- Test Compiled Rules --"
+        self.clear_test_state()
+        individuals = [Individual().do_mutations(constants.hi_muts_per_indiv)
+                       for x in range(10)]
+        for round in range(20):
+            self.clear_test_state()
+            self.gamestate.turn = random.randint(0, 99)
+            for x in range(40):
+                loc = (random.randint(1, 17), random.randint(1, 17))
+                if 'normal' in rg.loc_types(loc) and loc not in self.gamestate.robots:
+                    self.gamestate.add_robot(loc, random.randint(0, 1),
+                                             hp=random.randint(1, 50))
+            ally_fut = [[random.choice([0, 0, 0, 25, 50]) for y in range(19)]
+                        for x in range(19)]
+            attack_fut = [[random.random() < 0.2 for y in range(19)]
+                          for x in range(19)]
+            for indiv in individuals:
+                for bot in self.gamestate.robots.values():
+                    robot = indiv.get_robot()
+                    robot.location = bot.location
+                    robot.hp = bot.hp
+                    robot.player_id = bot.player_id
+                    game = self.gamestate.get_game_info(bot.player_id)
+                    if game.player_grid[bot.location[0]][bot.location[1]] != bot.player_id \
+                            or game.hp_grid[bot.location[0]][bot.location[1]] != bot.hp:
+                        print "Test Failed: occupancy grid disagrees with robots"
+                        return
+                    for rule in indiv.eval_order:
+                        compiled = rule.evaluate(game, robot, ally_fut, attack_fut)
+                        interpreted = rule.interpret(game, robot, ally_fut, attack_fut)
+                        # Direction only matters when the Rule is True
+                        if compiled[0] != interpreted[0] or \
+                                (compiled[0] and compiled != interpreted):
+                            print "Test Failed: compiled", compiled, \
+                                  "interpreted", interpreted
+                            return
+                indiv.mutate()
+                
+        print "PASSED"
+        
+    def test_simplified_rules(self):
+        """Verifies simplified Rules behave the same as the originals.
+        
+        Random Individuals and their simplified copies are evaluated against
+        random game states, and mutated between rounds.
+        """
+        
+        print "-- Test Simplified Rules --"
+        individuals = [Individual().do_mutations(constants.hi_muts_per_indiv)
+                       for x in range(10)]
+        for round in range(20):
+            self.clear_test_state()
+            self.gamestate.turn = random.randint(0, 99)
+            for x in range(40):
+                loc = (random.randint(1, 17), random.randint(1, 17))
+                # Robots are never on obstacles, which the simplifier relies on
+                if 'obstacle' not in rg.loc_types(loc) and loc not in self.gamestate.robots:
+                    self.gamestate.add_robot(loc, random.randint(0, 1),
+                                             hp=random.randint(1, 50))
+            ally_fut = [[random.choice([0, 0, 0, 25, 50]) for y in range(19)]
+                        for x in range(19)]
+            attack_fut = [[random.random() < 0.2 for y in range(19)]
+                          for x in range(19)]
+            for indiv in individuals:
+                simple = indiv.make_copy()
+                simple.simplify()
+                for rule, simple_rule in zip(indiv.eval_order, simple.eval_order):
+                    if len(simple_rule.node_list) > len(rule.node_list):
+                        print "Test Failed: simplified Rule has more Nodes"
+                        return
+                for bot in self.gamestate.robots.values():
+                    robot = indiv.get_robot()
+                    robot.location = bot.location
+                    robot.hp = bot.hp
+                    robot.player_id = bot.player_id
+                    game = self.gamestate.get_game_info(bot.player_id)
+                    for rule, simple_rule in zip(indiv.eval_order, simple.eval_order):
+                        original = rule.interpret(game, robot, ally_fut, attack_fut)
+                        simplified = simple_rule.interpret(game, robot, ally_fut,
+                                                           attack_fut)
+                        # Direction only matters when the Rule is True
+                        if original[0] != simplified[0] or \
+                                (original[0] and original != simplified):
+                            print "Test Failed: original", original, \
+                                  "simplified", simplified
+                            return
+                indiv.mutate()
+                
+        print "PASSED"
+        
+    def test_coordinator(self):
+        """Verifies a Coordinator gives a killed worker's task to another worker,
+        and that every process stops once it closes."""
+        
+        print "-- Test Coordinator --"
+        authkey = make_authkey()
+        coordinator = Coordinator(("localhost", 0), authkey, timeout=30.0)
+        workers = [Process(target=run_worker,
+                           args=(coordinator.address, authkey, None, 0.1))]
+        workers[0].start()
+        results = coordinator.imap_unordered(slow_task, range(4))
+        answers = [next(results)]
+        # The first worker is sent its next task as soon as it answers
+        time.sleep(0.2)
+        workers[0].terminate()
+        workers.append(Process(target=run_worker,
+                               args=(coordinator.address, authkey, None, 0.1)))
+        workers[1].start()
+        answers.extend(results)
+        coordinator.close()
+        coordinator.join()
+        for worker in workers:
+            worker.join(10.0)
+        if sorted(answers) != [0, 2, 4, 6]:
+            print "Test Failed: answers", answers
+            return
+        if any(worker.is_alive() for worker in workers):
+            print "Test Failed: a worker did not stop"
+            for worker in workers:
+                worker.terminate()
+            return
+        if workers[1].exitcode != 0:
+            print "Test Failed: worker exit code", workers[1].exitcode
+            return
+        print "PASSED"
+        
+    def test_racing(self):
+        """Verifies racing stops a clearly weaker Individual early, and keeps
+        Individuals with similar results in the race."""
+        
+        print "-- Test Racing --"
+        rounds = 10
+        games_per_round = 10
+        total_games = rounds * games_per_round
+        # Wins of each Individual per round: five similar ones and a hopeless one
+        streams = [[6, 5] * 5, [5, 6] * 5, [6, 5] * 5, [5, 6] * 5, [6, 6, 5, 5, 6] * 2,
+                   [0] * rounds]
+        wins = [0] * len(streams)
+        bounds = [(0, total_games)] * len(streams)
+        stopped = [None] * len(streams)
+        racing = range(len(streams))
+        # Bounds are checked after every round but the last
+        for round in range(rounds - 1):
+            for x in racing:
+                wins[x] += streams[x][round]
+                bounds[x] = robogen.score_bounds(wins[x], (round + 1) * games_per_round,
+                                                 total_games, 0, rounds - 1)
+            still_racing = robogen.still_racing(racing, bounds, 4)
+            for x in racing:
+                if x not in still_racing:
+                    stopped[x] = round
+            racing = still_racing
+        if stopped[-1] is None or stopped[-1] >= rounds / 2:
+            print "Test Failed: the weaker Individual stopped at round", stopped[-1]
+            return
+        if any(x is not None for x in stopped[:-1]):
+            print "Test Failed: similar Individuals stopped at rounds", stopped[:-1]
+            return
+        print "PASSED"
+        
+    def test_game_info_view(self):
+        """Verifies games play out the same whether bots see robots through
+        the get_game_info view or through a dict of AttrDicts, and that the
+        view's robots can be copied and pickled."""
+        
+        print "-- Test Game Info View --"
+        self.clear_test_state()
+        bot_file = os.path.join('rgkit', 'bots', 'liquid10.py')
+        for seed in range(2):
+            results = []
+            for game_info in (view_game_info, eager_game_info):
+                GameState.get_game_info = game_info
+                try:
+                    results.append(self.play_game([bot_file, bot_file], seed))
+                finally:
+                    GameState.get_game_info = view_game_info
+            if results[0] != results[1]:
+                print "Test Failed: games with seed", seed, "differ, scores", \
+                      results[0][0], "and", results[1][0]
+                return
+        
+        self.gamestate.add_robot(constants.testee_loc, 0)
+        robots = self.gamestate.get_game_info(0).robots
+        robot = robots[constants.testee_loc]
+        if copy.copy(robot) != robot or \
+                pickle.loads(pickle.dumps(robot, 2)) != robot or \
+                pickle.loads(pickle.dumps(robots, 2)) != robots:
+            print "Test Failed: copied robot", copy.copy(robot)
+            return
+        print "PASSED"
+        
+    def test_batch_game(self):
+        """Verifies a BatchGame ends its games with the same scores and robots
+        as playing each of them with Game."""
+        
+        print "-- Test Batch Game --"
+        if BatchGame is None:
+            print "SKIPPED: NumPy is not installed"
+            return
+        self.clear_test_state()
+        # Bots that don't use the global random module, which the games of a
+        # BatchGame share
+        matches = [('Dulladob01', 'KarenRoper10'),
+                   ('BetterThanTheRest', 'GhoulinatorV'),
+                   ('rowlake', 'snoflake')]
+        bot_files = [[os.path.join('rgkit', 'backup bots', name + '.py')
+                      for name in match] for match in matches]
+        seeds = range(len(matches))
+        batch = BatchGame([[Player(file_name=bot_file) for bot_file in files]
+                           for files in bot_files], seeds)
+        batch.run_all_turns()
+        batch_scores = batch.get_scores()
+        for game, seed in enumerate(seeds):
+            scores, robots = self.play_game(bot_files[game], seed)
+            if batch_scores[game] != scores or \
+                    self.get_robots(batch.get_state(game)) != robots:
+                print "Test Failed: game", game, "Game scores", scores, \
+                      "BatchGame scores", batch_scores[game]
+                return
+        print "PASSED"
+        
+    def play_game(self, bot_files, seed):
+        """Plays a seeded game between the given bots.
+        
+        Returns the scores and the robots left at the end."""
+        
+        random.seed(seed)
+        game = Game([Player(file_name=bot_file) for bot_file in bot_files],
+                    seed=seed)
+        game.run_all_turns()
+        return game.get_scores(), \
+            self.get_robots(game.get_state(settings.max_turns))
+        
+    def get_robots(self, state):
+        """Returns the (loc, hp, player_id, robot_id) of a GameState's robots."""
+        
+        return sorted((loc, robot.hp, robot.player_id, robot.robot_id)
+                      for loc, robot in state.robots.items())
+        
     def init_children_test(self, num_children):
 
         self.clear_test_state()
@@ -670,7 +952,7 @@ class Test:
         new_node = Node.new_random_node()
         node.insert_child_randomly(new_node)
         new_node.parent = node
-        rule.node_list.append(new_node)
+        rule.add_node(new_node)
 
         
 def main():
@@ -681,6 +963,12 @@ def main():
     test.test_all_node_types()
     test.test_not_op()
     test.test_children()
+    test.test_compiled_rules()
+    test.test_simplified_rules()
+    test.test_coordinator()
+    test.test_racing()
+    test.test_game_info_view()
+    test.test_batch_game()
 
     
 if __name__ == '__main__':
@@ -1,11 +1,20 @@
 import random
 
 from rgkit import rg
+from rgkit.settings import settings, LOC_SPAWN, LOC_OBSTACLE, LOC_INVALID
 
 import constants
 
 class Rule:
 
+    # Compiled form of this Rule, None once its Nodes have been edited, and
+    # the root it was compiled from
+    _compiled = None
+    _compiled_root = None
+
+    # (x, y) offsets for each direction. Any other direction moves RIGHT.
+    dir_offsets = {"UP": (0, 1), "DOWN": (0, -1), "LEFT": (-1, 0)}
+
     def __init__(self, arg_action):
         self.action = arg_action
         self.root = None
@@ -18,6 +27,49 @@ class Rule:
         self.recursive_node_copy(self.root, None, result)
         return result
         
+    def mark_edited(self):
+        """Recompiles this Rule on its next evaluation.
+        
+        Called by every method that edits the Rule's Nodes, and whenever a
+        field of one of its Nodes is set. Code changing a Node's children list
+        in place must call it too."""
+        
+        self._compiled = None
+        
+    def add_node(self, node):
+        """Appends node to node_list, remembering its position there and that
+        it belongs to this Rule."""
+        
+        node.list_idx = len(self.node_list)
+        node.rule = self
+        self.node_list.append(node)
+        self.mark_edited()
+        
+    def remove_node(self, node):
+        """Removes node from node_list in O(1), moving the last Node into its
+        position."""
+        
+        idx = node.list_idx
+        if not (0 <= idx < len(self.node_list)) or self.node_list[idx] is not node:
+            # Appended without add_node()
+            idx = self.node_list.index(node)
+        last = self.node_list.pop()
+        if last is not node:
+            self.node_list[idx] = last
+            last.list_idx = idx
+        node.list_idx = -1
+        if node.rule is self:
+            node.rule = None
+        self.mark_edited()
+        
+    def __getstate__(self):
+        """Drops the compiled closure, which can't be pickled."""
+        
+        state = self.__dict__.copy()
+        state.pop('_compiled', None)
+        state.pop('_compiled_root', None)
+        return state
+        
     @staticmethod
     def recursive_node_copy(node, other_parent, other_rule):
         """Recursively copies a Node tree."""
@@ -25,7 +77,7 @@ class Rule:
         node_copy = None
         if node is not None:
             node_copy = node.make_copy()
-            other_rule.node_list.append(node_copy)
+            other_rule.add_node(node_copy)
             node_copy.parent = other_parent
             if node.is_root():
                 other_rule.root = node_copy
@@ -42,7 +94,7 @@ class Rule:
         
         if self.root is None:
             self.root = Node.new_random_node(True)
-            self.node_list.append(self.root)
+            self.add_node(self.root)
         else:
             idx = random.randint(0, (len(self.node_list) - 1))
             node = self.node_list[idx]
@@ -51,7 +103,7 @@ class Rule:
                 node.parent = self.root
                 node.root = False
                 self.root.children.append(node)
-                self.node_list.append(self.root)
+                self.add_node(self.root)
             else:
                 new_node = Node.new_random_node()
                 new_node.parent = node.parent
@@ -59,7 +111,7 @@ class Rule:
                 node.parent.children[idx_as_child] = new_node
                 new_node.children.append(node)
                 node.parent = new_node
-                self.node_list.append(new_node)
+                self.add_node(new_node)
         
     def insert_random_child(self):
         """Creates a child Node for a random Node.
@@ -68,14 +120,14 @@ class Rule:
         
         if self.root is None:
             self.root = Node.new_random_node(True)
-            self.node_list.append(self.root)
+            self.add_node(self.root)
         else:
             idx = random.randint(0, (len(self.node_list) - 1))
             node = self.node_list[idx]
             new_node = Node.new_random_node()
             node.insert_child_randomly(new_node)
             new_node.parent = node
-            self.node_list.append(new_node)
+            self.add_node(new_node)
     
     def delete_random_node(self):
         """Deletes a random Node."""
@@ -90,12 +142,12 @@ class Rule:
         if node.is_root():
             # No children = delete all
             if len(node.children) == 0:
-                self.node_list.remove(node)
+                self.remove_node(node)
                 self.root = None
             # One child = make child root
             elif len(node.children) == 1:
                 child = node.children[0]
-                self.node_list.remove(node)
+                self.remove_node(node)
                 self.root = child
                 child.parent = None
                 child.root = True
@@ -104,7 +156,7 @@ class Rule:
                 first_child = node.children[0]
                 first_child.parent = None
                 first_child.root = True
-                self.node_list.remove(node)
+                self.remove_node(node)
                 self.root = first_child
                 for idx in range(1, len(node.children)):
                     child = node.children[idx]
@@ -113,8 +165,8 @@ class Rule:
         # Not root = shift children up
         else:
             par = node.parent
-            par.children.remove(node)
-            self.node_list.remove(node)
+            par.remove_child(node)
+            self.remove_node(node)
             for child in node.children:
                 par.insert_child_randomly(child)
                 child.parent = par
@@ -129,7 +181,7 @@ class Rule:
         if node.is_root():
             self.root = None
         else:
-            node.parent.children.remove(node)
+            node.parent.remove_child(node)
         self.delete_branch_at(node)
         
     def delete_branch_at(self, node):
@@ -137,14 +189,14 @@ class Rule:
         
         if not len(self.node_list):
             return
-        self.node_list.remove(node)
+        self.remove_node(node)
         for child in node.children:
             self.delete_branch_at(child)
             
     def add_branch_at(self, node):
         """Recursively add branch to node_list."""
         
-        self.node_list.append(node)
+        self.add_node(node)
         for child in node.children:
             self.add_branch_at(child)
         
@@ -159,6 +211,7 @@ class Rule:
             node.op = "OR"
         else:
             node.op = "AND"
+        self.mark_edited()
                 
     def flip_random_not_op(self):
         """Flip the NOT operator of a random node."""
@@ -168,6 +221,7 @@ class Rule:
         idx = random.randint(0, (len(self.node_list) - 1))
         node = self.node_list[idx]
         node.not_op = not node.not_op
+        self.mark_edited()
         
     def swap_random_nodes(self):
         """Swap two random nodes."""
@@ -220,6 +274,7 @@ class Rule:
                 child.parent = node1
             for child in node2.children:
                 child.parent = node2
+            self.mark_edited()
         
     def swap_random_branches(self):
         """Swap two random branches."""
@@ -244,15 +299,15 @@ class Rule:
             temp = node1.parent
             node1.parent = node2.parent
             node2.parent = temp
+            self.mark_edited()
         
     def node_precedes_other(self, node, other):
-        """Check if Node is an ancestor of other Node."""
+        """Check if Node is an ancestor of other Node, or is other Node."""
         
-        if node is other:
-            return True
-        for child in node.children:
-            if self.node_precedes_other(child, other):
+        while other is not None:
+            if other is node:
                 return True
+            other = other.parent
         return False
         
     def change_random_direction(self):
@@ -263,6 +318,7 @@ class Rule:
         idx = random.randint(0, (len(self.node_list) - 1))
         node = self.node_list[idx]
         node.direction = random.choice(Node.directions)
+        self.mark_edited()
         
     def jumble_random_child_order(self):
         """Shuffle child order of random Node."""
@@ -272,6 +328,7 @@ class Rule:
         idx = random.randint(0, (len(self.node_list) - 1))
         node = self.node_list[idx]
         random.shuffle(node.children)
+        self.mark_edited()
             
     @staticmethod
     def gen_rloc_gaussian():
@@ -288,13 +345,66 @@ class Rule:
             y = -constants.rloc_max_step
         return (x, y)
         
+    def simplify(self):
+        """Removes Nodes that can never change what this Rule returns.
+        
+        A Rule that can never be True loses its whole tree, as an empty Rule is
+        never True either."""
+        
+        if self.root is None:
+            return
+        if self.root.simplify(Node.hp_range, Node.spawn_range) is False:
+            self.root = None
+        kept = set()
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            kept.add(id(node))
+            stack.extend(node.children)
+        self.node_list = [node for node in self.node_list if id(node) in kept]
+        for idx, node in enumerate(self.node_list):
+            node.list_idx = idx
+        self.mark_edited()
+        
+    def limit_size(self, max_nodes):
+        """Deletes random branches below the root until this Rule has at most
+        max_nodes Nodes."""
+        
+        while len(self.node_list) > max(max_nodes, 1):
+            node = random.choice(self.node_list)
+            if node.is_root():
+                continue
+            node.parent.remove_child(node)
+            self.delete_branch_at(node)
+        
     def debug_print(self):
         print "Root:", self.root
         if self.root is not None:
             self.root.debug_print()
         
+    def genome_key(self):
+        """Returns a nested tuple describing this Rule's action and Node tree.
+        
+        Rules with equal keys behave the same."""
+        
+        if self.root is None:
+            return (self.action, None)
+        return (self.action, self.root.genome_key())
+        
     def evaluate(self, game, robot, ally_fut, attack_fut):
-        """Evaluates this Rule given game state and shared-decision fields."""
+        """Evaluates this Rule given game state and shared-decision fields.
+        
+        Uses the compiled form of this Rule, compiling it first if the Rule
+        has been edited since it was last compiled."""
+        
+        if self._compiled is None or self._compiled_root is not self.root:
+            self.compile()
+        return self._compiled(game, robot, ally_fut, attack_fut)
+        
+    def interpret(self, game, robot, ally_fut, attack_fut):
+        """Evaluates this Rule by walking its Node tree.
+        
+        This is the reference behavior for compile()."""
         
         if self.root is None:
             return [False, 'guard']
@@ -310,6 +420,34 @@ class Rule:
             else:
                 result.append((robot.location[0] + 1, robot.location[1]))
         return result
+        
+    def compile(self):
+        """Compiles this Rule into a closure equivalent to interpret().
+        
+        The Node tree is specialized once, so evaluating the closure does no
+        dispatching on Node fields."""
+        
+        self._compiled_root = self.root
+        action = self.action
+        
+        if self.root is None:
+            def rule_fn(game, robot, ally_fut, attack_fut):
+                return [False, 'guard']
+        elif action == 'move' or action == 'attack':
+            node_fn = self.root.compile()
+            offsets = Rule.dir_offsets
+            def rule_fn(game, robot, ally_fut, attack_fut):
+                act = node_fn(game, robot, ally_fut, attack_fut)
+                dx, dy = offsets.get(act[1], (1, 0))
+                loc = robot.location
+                return [act[0], action, (loc[0] + dx, loc[1] + dy)]
+        else:
+            node_fn = self.root.compile()
+            def rule_fn(game, robot, ally_fut, attack_fut):
+                return [node_fn(game, robot, ally_fut, attack_fut)[0], action]
+        
+        self._compiled = rule_fn
+        return rule_fn
     
         
 class Node:
@@ -321,6 +459,17 @@ class Node:
     rloc_types = ("ENEMY", "SPAWN", "INVALID", "EMPTY", "ALLY", "ALLY_FUT", "ATT_FUT")
     directions = ("UP", "DOWN", "RIGHT", "LEFT")
     rloc_w_hp = ("ENEMY", "ALLY", "ALLY_FUT")
+    # Locations no robot can be in
+    blocked = LOC_OBSTACLE | LOC_INVALID
+    # Inclusive ranges of every robot's HP and of turns since spawn (turn % 10)
+    hp_range = (1, 50)
+    spawn_range = (0, 9)
+    
+    # Position in its Rule's node_list, and the Rule, kept by Rule.add_node()
+    list_idx = -1
+    rule = None
+    # Fields that its Rule is not compiled from
+    bookkeeping = ("list_idx", "rule", "parent")
 
     def __init__(self, operation, arg_type, par=None, arg_hp=0, arg_comp_op="LT",
                  arg_spawn=0, arg_rloc_type="EMPTY", arg_rloc=(0,0), arg_dir=None,
@@ -338,7 +487,21 @@ class Node:
         self.hp = arg_hp
         self.comp_op = arg_comp_op
         self.turns_since_spawn = arg_spawn
-                
+        
+    def __setattr__(self, name, value):
+        """Sets a field, marking this Node's Rule edited if the Rule's compiled
+        form could depend on it."""
+        
+        self.__dict__[name] = value
+        if self.rule is not None and name not in Node.bookkeeping:
+            self.rule.mark_edited()
+            
+    def mark_edited(self):
+        """Marks this Node's Rule, if any, for recompiling."""
+        
+        if self.rule is not None:
+            self.rule.mark_edited()
+        
     @staticmethod
     def new_random_node(root=False):
         """Creates a random Node."""
@@ -374,19 +537,29 @@ class Node:
             self.children.append(child)
         else:
             self.children.insert((random.randint(0, (len(self.children) - 1))), child)
+        self.mark_edited()
         
     def remove_child(self, child):
         """Removes the child from this Node's children list."""
         
         self.children.remove(child)
+        self.mark_edited()
         
     def remove_child_by_idx(self, idx):
         """Removes the child at idx in Node's children list."""
         
         del self.children[idx]
+        self.mark_edited()
 
     def is_root(self):
         return self.root
+        
+    def genome_key(self):
+        """Returns a nested tuple of this Node's fields and its children's keys."""
+        
+        return (self.op, self.type, self.not_op, self.rloc_type, self.rloc,
+                self.hp, self.comp_op, self.turns_since_spawn, self.direction,
+                tuple(child.genome_key() for child in self.children))
             
     def make_copy(self):
         """Creates copy of this node.
@@ -415,38 +588,34 @@ class Node:
                 result = True
         elif self.type == "RLOC":
             true_loc = (robot.location[0] + self.rloc[0], robot.location[1] + self.rloc[1])
-            bots = game.get('robots')
+            player_at = Node.player_at(game, true_loc)
             check_hp = False
             hp_to_check = 0
             if self.rloc_type == "ENEMY":
-                if true_loc in bots.keys():
-                    bot = bots[true_loc]
-                    if bot.player_id != robot.player_id:
-                        check_hp = True
-                        hp_to_check = bot.hp
+                if player_at != -1 and player_at != robot.player_id:
+                    check_hp = True
+                    hp_to_check = game['hp_grid'][true_loc[0]][true_loc[1]]
             elif self.rloc_type == "SPAWN":
-                if 'spawn' in rg.loc_types(true_loc):
+                if rg.loc_mask(true_loc) & LOC_SPAWN:
                     result = True
             elif self.rloc_type == "INVALID":
-                if any(x in rg.loc_types(true_loc) for x in ['obstacle', 'invalid']):
+                if rg.loc_mask(true_loc) & Node.blocked:
                     result = True
             elif self.rloc_type == "EMPTY":
-                if not any(x in rg.loc_types(true_loc) for x in ['obstacle', 'invalid']):
-                    if true_loc not in bots.keys():
+                if not rg.loc_mask(true_loc) & Node.blocked:
+                    if player_at == -1:
                         result = True
             elif self.rloc_type == "ALLY":
-                if true_loc in bots.keys():
-                    bot = bots[true_loc]
-                    if bot.player_id == robot.player_id:
-                        check_hp = True
-                        hp_to_check = bot.hp
+                if player_at == robot.player_id:
+                    check_hp = True
+                    hp_to_check = game['hp_grid'][true_loc[0]][true_loc[1]]
             elif self.rloc_type == "ALLY_FUT":
-                if not any(x in rg.loc_types(true_loc) for x in ['obstacle', 'invalid']):
+                if not rg.loc_mask(true_loc) & Node.blocked:
                     hp_to_check = ally_fut[true_loc[0]][true_loc[1]]
                     if hp_to_check > 0:
                         check_hp = True
             elif self.rloc_type == "ATT_FUT":
-                if not any(x in rg.loc_types(true_loc) for x in ['obstacle', 'invalid']):
+                if not rg.loc_mask(true_loc) & Node.blocked:
                     result = (attack_fut[true_loc[0]][true_loc[1]] > 0)
             if check_hp:
                 if self.comp_op == "LT" and hp_to_check < self.hp:
@@ -474,6 +643,283 @@ class Node:
                 return ch_result
         return ((result and and_still_possible), dir_result)
             
+    @staticmethod
+    def player_at(game, loc):
+        """Returns the player id of the robot at loc, or -1 if there is none.
+        
+        Looks loc up in the game's player_grid, so loc may be off the board."""
+        
+        size = settings.board_size
+        if 0 <= loc[0] < size and 0 <= loc[1] < size:
+            return game['player_grid'][loc[0]][loc[1]]
+        return -1
+            
+    def compile(self):
+        """Compiles this Node and its children into a closure equivalent to
+        evaluate()."""
+        
+        test = self.compile_test()
+        direction = self.direction
+        children = [(child.op == "AND", child.compile()) for child in self.children]
+        
+        if not children:
+            def node_fn(game, robot, ally_fut, attack_fut):
+                return (test(game, robot, ally_fut, attack_fut), direction)
+            return node_fn
+        
+        # Same precedence as evaluate(). AND children can only matter while
+        # this Node is still True, so they are skipped once it is False.
+        def node_fn(game, robot, ally_fut, attack_fut):
+            result = test(game, robot, ally_fut, attack_fut)
+            dir_result = direction
+            for is_and, child in children:
+                if is_and:
+                    if result:
+                        ch_result = child(game, robot, ally_fut, attack_fut)
+                        result = ch_result[0]
+                        dir_result = ch_result[1]
+                else:
+                    ch_result = child(game, robot, ally_fut, attack_fut)
+                    if ch_result[0]:
+                        return ch_result
+            return (result, dir_result)
+        return node_fn
+        
+    def compile_bounds(self, value):
+        """Returns exclusive (low, high) bounds satisfying this Node's comp_op.
+        
+        Returns None if the comparison can never be True."""
+        
+        if self.comp_op == "LT":
+            return (float("-inf"), value)
+        elif self.comp_op == "GT":
+            return (value, float("inf"))
+        return None
+        
+    def test_interval(self):
+        """Returns the inclusive (low, high) values an HP or SPAWN Node's
+        comparison is True for, ignoring its NOT op.
+        
+        Returns None if the comparison can never be True."""
+        
+        value = self.hp if self.type == "HP" else self.turns_since_spawn
+        if self.comp_op == "LT":
+            return (float("-inf"), value - 1)
+        elif self.comp_op == "GT":
+            return (value + 1, float("inf"))
+        return None
+        
+    def constant_test(self, hp_range, spawn_range):
+        """Returns the value of this Node's own expression, NOT op included, if
+        it is the same for every robot HP in hp_range and turn % 10 in
+        spawn_range. Otherwise returns None."""
+        
+        negate = bool(self.not_op)
+        if self.type == "HP" or self.type == "SPAWN":
+            interval = self.test_interval()
+            known = hp_range if self.type == "HP" else spawn_range
+            if interval is None or interval[1] < known[0] or interval[0] > known[1]:
+                return negate
+            if interval[0] <= known[0] and known[1] <= interval[1]:
+                return not negate
+            return None
+        elif self.type != "RLOC":
+            return negate
+        # The robot itself is at (0, 0)
+        if self.rloc == (0, 0) and self.rloc_type in ("ENEMY", "EMPTY", "INVALID"):
+            return negate
+        if self.rloc_type in Node.rloc_w_hp:
+            bounds = self.compile_bounds(self.hp)
+            if (bounds is None or bounds[1] <= Node.hp_range[0]
+                    or bounds[0] >= Node.hp_range[1]):
+                return negate
+        return None
+        
+    def narrow_ranges(self, hp_range, spawn_range):
+        """Returns (hp_range, spawn_range) narrowed to where this Node's own
+        expression is True."""
+        
+        if self.type != "HP" and self.type != "SPAWN":
+            return (hp_range, spawn_range)
+        interval = self.test_interval()
+        if interval is None:
+            return (hp_range, spawn_range)
+        if self.not_op:
+            if interval[0] == float("-inf"):
+                interval = (interval[1] + 1, float("inf"))
+            else:
+                interval = (float("-inf"), interval[0] - 1)
+        if self.type == "HP":
+            hp_range = (max(hp_range[0], interval[0]), min(hp_range[1], interval[1]))
+        else:
+            spawn_range = (max(spawn_range[0], interval[0]),
+                           min(spawn_range[1], interval[1]))
+        return (hp_range, spawn_range)
+        
+    def simplify(self, hp_range, spawn_range):
+        """Removes children that can never change what this Node returns.
+        
+        hp_range and spawn_range are the robot HP and turn % 10 values this
+        Node can matter for. Follows the precedence of evaluate(): the first
+        True OR child decides the result, otherwise this Node's expression AND
+        its AND children do, with the direction of the last AND child.
+        
+        Returns True or False if this Node's result is always the same where
+        it matters, otherwise None."""
+        
+        test = self.constant_test(hp_range, spawn_range)
+        and_hp, and_spawn = self.narrow_ranges(hp_range, spawn_range)
+        ands = []
+        ors = []
+        or_keys = set()
+        or_true = False
+        for child in self.children:
+            if child.op == "AND":
+                # AND children only count while this Node is True
+                if test is not False:
+                    ands.append((child, child.simplify(and_hp, and_spawn)))
+            elif not or_true:
+                value = child.simplify(hp_range, spawn_range)
+                key = child.genome_key()
+                # Never True, or only True when an earlier copy already is
+                if value is False or key in or_keys:
+                    continue
+                or_keys.add(key)
+                ors.append(child)
+                # OR children after an always True one are never reached
+                or_true = (value is True)
+        
+        and_values = [value for child, value in ands]
+        if or_true:
+            ands = []
+        elif False in and_values:
+            # One always False AND child is enough to keep this Node False
+            ands = [(child, value) for child, value in ands if value is False][:1]
+        else:
+            # Only the last AND child sets the direction, so earlier copies
+            # and always True AND children before it make no difference
+            kept = []
+            keys = set()
+            for child, value in reversed(ands):
+                key = child.genome_key()
+                if key in keys or (value is True and kept):
+                    continue
+                keys.add(key)
+                kept.append((child, value))
+            ands = kept
+        
+        kept_ids = set(id(child) for child in ors)
+        kept_ids.update(id(child) for child, value in ands)
+        if len(kept_ids) != len(self.children):
+            self.children = [child for child in self.children if id(child) in kept_ids]
+        
+        if or_true:
+            return True
+        if test is False or False in and_values:
+            return False if not ors else None
+        if test is True and all(value is True for value in and_values):
+            return True
+        return None
+        
+    def compile_test(self):
+        """Compiles this Node's own expression, including its NOT op."""
+        
+        negate = bool(self.not_op)
+        
+        def constant(game, robot, ally_fut, attack_fut):
+            return negate
+        
+        if self.type == "SPAWN":
+            bounds = self.compile_bounds(self.turns_since_spawn)
+            if bounds is None:
+                return constant
+            low, high = bounds
+            def test(game, robot, ally_fut, attack_fut):
+                return (low < (game['turn'] % 10) < high) != negate
+            return test
+        elif self.type == "HP":
+            bounds = self.compile_bounds(self.hp)
+            if bounds is None:
+                return constant
+            low, high = bounds
+            def test(game, robot, ally_fut, attack_fut):
+                return (low < robot.hp < high) != negate
+            return test
+        elif self.type != "RLOC":
+            return constant
+        
+        dx, dy = self.rloc
+        # Updated in place whenever a map is loaded
+        masks = settings.loc_masks
+        blocked = Node.blocked
+        rloc_type = self.rloc_type
+        if rloc_type == "SPAWN":
+            def test(game, robot, ally_fut, attack_fut):
+                loc = robot.location
+                return bool(masks.get((loc[0] + dx, loc[1] + dy), LOC_INVALID)
+                            & LOC_SPAWN) != negate
+            return test
+        elif rloc_type == "INVALID":
+            def test(game, robot, ally_fut, attack_fut):
+                loc = robot.location
+                return bool(masks.get((loc[0] + dx, loc[1] + dy), LOC_INVALID)
+                            & blocked) != negate
+            return test
+        elif rloc_type == "EMPTY":
+            def test(game, robot, ally_fut, attack_fut):
+                loc = robot.location
+                x = loc[0] + dx
+                y = loc[1] + dy
+                return (not masks.get((x, y), LOC_INVALID) & blocked
+                        and game['player_grid'][x][y] == -1) != negate
+            return test
+        elif rloc_type == "ATT_FUT":
+            def test(game, robot, ally_fut, attack_fut):
+                loc = robot.location
+                x = loc[0] + dx
+                y = loc[1] + dy
+                return (not masks.get((x, y), LOC_INVALID) & blocked
+                        and attack_fut[x][y] > 0) != negate
+            return test
+        elif rloc_type not in Node.rloc_w_hp:
+            return constant
+        
+        # The remaining types compare the HP found at the location
+        bounds = self.compile_bounds(self.hp)
+        if bounds is None:
+            return constant
+        low, high = bounds
+        size = settings.board_size
+        if rloc_type == "ENEMY":
+            def test(game, robot, ally_fut, attack_fut):
+                loc = robot.location
+                x = loc[0] + dx
+                y = loc[1] + dy
+                if not (0 <= x < size and 0 <= y < size):
+                    return negate
+                player = game['player_grid'][x][y]
+                return (player != -1 and player != robot.player_id
+                        and low < game['hp_grid'][x][y] < high) != negate
+        elif rloc_type == "ALLY":
+            def test(game, robot, ally_fut, attack_fut):
+                loc = robot.location
+                x = loc[0] + dx
+                y = loc[1] + dy
+                if not (0 <= x < size and 0 <= y < size):
+                    return negate
+                return (game['player_grid'][x][y] == robot.player_id
+                        and low < game['hp_grid'][x][y] < high) != negate
+        else:
+            def test(game, robot, ally_fut, attack_fut):
+                loc = robot.location
+                x = loc[0] + dx
+                y = loc[1] + dy
+                if masks.get((x, y), LOC_INVALID) & blocked:
+                    return negate
+                hp = ally_fut[x][y]
+                return (hp > 0 and low < hp < high) != negate
+        return test
+            
     def debug_print(self, indent=0):
         i_str = ""
         for x in range(indent):